@@ -1,8 +1,8 @@
 
 import streamlit as st
-import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
+import os
 import sys
 from pathlib import Path
 
@@ -11,28 +11,91 @@ scripts_path = Path(__file__).parent.parent / "scripts"
 sys.path.append(str(scripts_path))
 
 from eda import run_eda
-from analyze_distributions import calculate_additional_columns, plot_distribution
+from analyze_distributions import plot_distribution
 from analyze_price_factors import analyze_numeric_corr
 from analyze_special_cases import (
-    prepare_dataframe,
     analyze_by_build_decade,
     analyze_price_by_location,
-    analyze_price_per_sqm,
     find_smallest_most_expensive
 )
+from comparables import find_comparables, price_spread
+from spatial import get_spatial_layer, nearest_stations, radius_summary
+from price_model import coefficients, fit_price_model, flag_mispriced, load_model, update_price_model
+from ranking import get_ranking_index, top_k, value_range
+from live_data import load_state, refresh_state
+from dedup import collapse_duplicates
+from bootstrap import bootstrap_groups, column_groups, group_fingerprints
+from density_plots import histplot
 
 # Настройки
 st.set_page_config(page_title="Анализ аренды квартир", layout="wide")
 data_path = Path(__file__).parent.parent / "data" / "processed_offers.csv"
 
-@st.cache_data
-def load_data():
-    df = pd.read_csv(data_path)
-    df = prepare_dataframe(df)
-    df = calculate_additional_columns(df)
-    return df
-
-df = load_data()
+# Как часто проверять, не появился ли новый обход
+RELOAD_INTERVAL = "10s"
+# Доля изменившихся строк, после которой интервалы по группам пересчитываются целиком
+INTERVALS_REFRESH_SHARE = 0.05
+# Компактный режим памяти — настройка процесса (DASHBOARD_COMPACT=0 отключает), а не флажок
+# сеанса: состояние общее для всех сеансов, и вторая копия данных жила бы до перезапуска
+COMPACT_MODE = os.environ.get("DASHBOARD_COMPACT", "1") != "0"
+# Сколько объявлений показывать в списке выбора на странице похожих
+MAX_CHOICES = 200
+
+@st.cache_resource
+def get_data_state():
+    # Общее для всех сеансов состояние: датафрейм дописывается на месте при новых данных
+    return load_state(data_path, compact=COMPACT_MODE)
+
+def group_intervals(state, df, column, n_resamples=10_000):
+    # Бутстреп-интервалы и p-значения по группам (считаются в пуле процессов).
+    # После подгрузки данных пересчитываются только группы с изменившимися значениями;
+    # p-значения остальных опираются на прежнюю общую выборку, поэтому когда с полного
+    # расчёта изменилось больше INTERVALS_REFRESH_SHARE строк, пересчитывается всё.
+    groups = column_groups(df, column)
+    fingerprints = group_fingerprints(groups)
+    pooled = df["price"].to_numpy(dtype=float)
+    cached = state.setdefault("intervals", {}).get((column, n_resamples))
+    if cached is None or state["changed_rows"] - cached["changed_rows"] > INTERVALS_REFRESH_SHARE * len(df):
+        table = bootstrap_groups(groups, pooled=pooled, n_resamples=n_resamples)
+        cached = {"changed_rows": state["changed_rows"]}
+    else:
+        stale = {label: values for label, values in groups.items() if cached["fingerprints"].get(label) != fingerprints[label]}
+        table = cached["table"].drop(list(stale), errors="ignore")
+        if stale:
+            table = bootstrap_groups(stale, pooled=pooled, n_resamples=n_resamples).combine_first(table)
+        table = table.reindex(list(groups)).dropna(how="all")
+    state["intervals"][(column, n_resamples)] = {**cached, "table": table, "fingerprints": fingerprints}
+    return table.sort_values("mean", ascending=False).round(4)
+
+def get_price_model(state):
+    # Сохранённая конвейером модель; если её нет — обучаем на текущих данных
+    if state.get("price_model") is None:
+        model = load_model()
+        state["price_model"] = model if model is not None else fit_price_model(state["df"])
+    return state["price_model"]
+
+state = get_data_state()
+# df и ключ его версии берутся одной парой, чтобы индексы не перепутали версии
+(df, data_version), memory = state["frame"], state["memory"]
+
+@st.fragment(run_every=RELOAD_INTERVAL)
+def watch_new_data():
+    # Новые и изменённые строки дописываются в общее состояние, страница перерисовывается
+    seen = st.session_state.setdefault("data_version", state["version"])
+    changes = refresh_state(state)
+    if changes and state.get("price_model") is not None:
+        update_price_model(state["price_model"], changes["rows"], removed=changes["removed_links"])
+    if state["version"] != seen:
+        st.session_state["data_version"] = state["version"]
+        st.rerun()
+
+watch_new_data()
+if state["last_update"]:
+    update = state["last_update"]
+    st.sidebar.caption(
+        f"Данные обновлены в {update['at']}: +{update['new']} новых, {update['changed']} изменённых, "
+        f"{update['removed']} снятых ({update['seconds']} с)"
+    )
 
 st.sidebar.title("Меню навигации")
 page = st.sidebar.radio("Перейти к:", [
@@ -40,28 +103,26 @@ page = st.sidebar.radio("Перейти к:", [
     "📊 Данные",
     "🔍 EDA",
     "📈 Тренды и закономерности",
+    "💰 Оценка цен",
+    "🔎 Похожие объявления",
+    "🗺️ Карта цен",
     "📌 Выводы и рекомендации"
 ])
 
-# Переопределяем проблемную функцию
-def analyze_price_per_sqm_patch(df):
+OFFER_COLUMNS = ["price", "square_meters", "price_per_sqm", "address", "metro"]
+
+def price_per_sqm_summary(df):
+    # Вариант analyze_price_per_sqm для Streamlit: гистограмма выводится на страницу
     valid = df[df["price_per_sqm"].notna()]
     stats = valid["price_per_sqm"].describe().round(2)
-    top5_table = valid.sort_values("price_per_sqm", ascending=False).head(5)[
-        ["price", "square_meters", "price_per_sqm", "address", "metro"]
-    ].round(2)
     plt.figure(figsize=(10, 4))
-    sns.histplot(valid["price_per_sqm"], bins=40, kde=True)
+    histplot(valid["price_per_sqm"], ax=plt.gca(), bins=40)
     plt.title("Распределение цены за квадратный метр")
     plt.xlabel("Цена за м², ₽")
     plt.tight_layout()
     st.pyplot(plt.gcf())
     plt.clf()
-    return stats, top5_table
-
-# Подменяем оригинальную функцию
-import analyze_special_cases
-analyze_special_cases.analyze_price_per_sqm = analyze_price_per_sqm_patch
+    return stats
 
 if page == "🏠 Главная":
     st.title("Проект: Анализ факторов, влияющих на цену посуточной аренды квартир в Москве")
@@ -107,6 +168,15 @@ elif page == "📊 Данные":
     col2.metric("Пропусков всего", df.isna().sum().sum())
     col3.metric("Уникальных адресов", df['address'].nunique())
 
+    if memory is not None:
+        st.subheader("Память датафрейма")
+        total = memory.loc["Итого"]
+        st.markdown(
+            f"Компактный режим: **{total['после, МБ']} МБ** вместо {total['до, МБ']} МБ "
+            f"(в {total['сжатие, раз']} раза меньше)."
+        )
+        st.dataframe(memory)
+
 elif page == "🔍 EDA":
     st.title("Исследовательский анализ данных")
     st.markdown("""
@@ -263,36 +333,173 @@ _Сухие метры без контекста не объясняют цен
 
     elif option == "Цена по эпохам постройки":
         st.subheader("Средняя цена по эпохам")
-        summary = analyze_by_build_decade(df)
+        show_ci = st.checkbox("Показать 95% доверительные интервалы и p-значения", value=True)
+        summary = analyze_by_build_decade(df, ci=show_ci)
         st.dataframe(summary)
         st.pyplot(plt.gcf())
         plt.clf()
 
     elif option == "Средняя цена по метро":
         st.subheader("ТОП станций метро")
-        metro_table, _ = analyze_price_by_location(df)
+        metro_table, _ = analyze_price_by_location(df, dedup=True)
         st.dataframe(metro_table)
         st.pyplot(plt.gcf())
         plt.clf()
 
+        with st.expander("Доверительные интервалы по всем станциям"):
+            st.markdown("95% бутстреп-интервал средней цены и p-значение перестановочного теста "
+                        "«станция отличается от остальных». Широкий интервал — мало объявлений.")
+            st.dataframe(group_intervals(state, collapse_duplicates(df), "metro"))
+
     elif option == "ТОП-адреса по цене":
         st.subheader("ТОП адресов")
-        _, address_table = analyze_price_by_location(df)
+        _, address_table = analyze_price_by_location(df, dedup=True)
         st.dataframe(address_table)
         st.pyplot(plt.gcf())
         plt.clf()
 
     elif option == "Цена за м²":
         st.subheader("Цена за квадратный метр")
-        stats, top5_table = analyze_price_per_sqm(df)
-        st.write(stats)
-        st.dataframe(top5_table)
+        st.write(price_per_sqm_summary(df))
+
+        # ТОП и диапазоны читаются из ранжирующего индекса (строится один раз на версию данных)
+        index = get_ranking_index(df, data_version)
+        scope = st.radio("Срез", ["Все объявления", "Станция метро", "Эпоха постройки"], horizontal=True)
+        group = None
+        if scope != "Все объявления":
+            column = "metro" if scope == "Станция метро" else "build_decade"
+            values = sorted(str(value) for kind, value in index["groups"] if kind == column)
+            group = (column, st.selectbox(scope, values))
+
+        st.markdown("**ТОП-5 по цене за м²**")
+        st.dataframe(df.iloc[top_k(index, "price_per_sqm", 5, group=group)][OFFER_COLUMNS].round(2))
+
+        ceiling = int(df["price_per_sqm"].max()) + 1
+        low, high = st.slider("Цена за м², ₽", 0, ceiling, (0, ceiling))
+        in_range = value_range(index, "price_per_sqm", low, high, group=group)
+        st.caption(f"Объявлений в диапазоне: {len(in_range)} (показаны первые 100 по возрастанию цены за м²)")
+        st.dataframe(df.iloc[in_range[:100]][OFFER_COLUMNS].round(2))
 
     elif option == "Самая дорогая квартира за м²":
         st.subheader("Наиболее дорогой объект по м²")
         row = find_smallest_most_expensive(df)
         st.write(row)
 
+elif page == "💰 Оценка цен":
+    st.title("Модельная оценка цены")
+    st.markdown("""
+Гедоническая модель (гребневая регрессия логарифма цены) учитывает одновременно
+числовые признаки, станцию метро, эпоху постройки, отделку, санузел и элементы
+списков удобств, тегов и информации о доме. Объявления, цена которых заметно
+отличается от модельной, помечены как завышенные или заниженные.
+    """)
+    model = get_price_model(state)
+    threshold = st.slider("Порог отклонения от модельной цены, %", 10, 100, 30, step=5) / 100
+    scored = flag_mispriced(df, model, threshold=threshold)
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Объявлений", len(scored))
+    col2.metric("Завышена цена", int((scored["flag"] == "завышена").sum()))
+    col3.metric("Занижена цена", int((scored["flag"] == "занижена").sum()))
+
+    st.subheader("Переоценённые объявления")
+    st.dataframe(scored[scored["flag"] == "завышена"].sort_values("price_ratio", ascending=False))
+    st.subheader("Недооценённые объявления")
+    st.dataframe(scored[scored["flag"] == "занижена"].sort_values("price_ratio"))
+
+    st.subheader("Наиболее влиятельные признаки")
+    coefs = coefficients(model).drop("intercept")
+    st.dataframe(coefs.reindex(coefs.abs().sort_values(ascending=False).index).head(20).round(3))
+
+elif page == "🔎 Похожие объявления":
+    st.title("Похожие объявления")
+    st.markdown("""
+Для выбранного объявления ищутся ближайшие по площади, позиции по этажности,
+году постройки, типу отделки и набору удобств. Разброс их цен — ориентир
+для оценки выбранной квартиры. Повторные публикации той же квартиры
+в похожие не попадают.
+    """)
+    # Объявление задаётся ссылкой или выбирается после фильтра по станции и площади:
+    # подписи строятся только для отфильтрованных строк (диапазон — из ранжирующего индекса)
+    link = st.text_input("Ссылка на объявление (необязательно)").strip()
+    if link:
+        matches = df.index[(df["link"] == link).to_numpy()]
+        if not len(matches):
+            st.warning("Объявление с такой ссылкой не найдено")
+            st.stop()
+        selected = matches[0]
+    else:
+        index = get_ranking_index(df, data_version)
+        stations = sorted(str(value) for kind, value in index["groups"] if kind == "metro")
+        metro = st.selectbox("Станция метро", stations)
+        ceiling = int(df["square_meters"].max()) + 1
+        low, high = st.slider("Площадь, м²", 0, ceiling, (0, ceiling))
+        candidates = value_range(index, "square_meters", low, high, group=("metro", metro))
+        if not len(candidates):
+            st.info("Нет объявлений с такими параметрами")
+            st.stop()
+        shown = df.iloc[candidates[:MAX_CHOICES]]
+        labels = (
+            shown["address"].astype(str) + " — " + shown["square_meters"].astype(str) + " м², "
+            + shown["price"].astype(str) + " ₽"
+        )
+        if len(candidates) > MAX_CHOICES:
+            st.caption(f"Найдено {len(candidates)} объявлений, в списке первые {MAX_CHOICES} по площади — сузьте диапазон")
+        selected = st.selectbox("Выберите объявление", shown.index, format_func=lambda i: labels[i])
+    k = st.slider("Число похожих объявлений", 5, 30, 10)
+
+    comps = find_comparables(df, selected, k=k, version=data_version)
+    spread = price_spread(comps)
+    cols = st.columns(len(spread) + 1)
+    cols[0].metric("Цена выбранного", df.loc[selected, "price"])
+    for col, (name, value) in zip(cols[1:], spread.items()):
+        col.metric(name, value)
+    st.dataframe(comps)
+
+    plt.figure(figsize=(10, 3))
+    sns.histplot(comps["price"], bins=min(k, 15))
+    plt.axvline(df.loc[selected, "price"], color="red", linestyle="--", label="выбранное")
+    plt.title("Цены похожих объявлений")
+    plt.xlabel("Цена, ₽")
+    plt.legend()
+    st.pyplot(plt.gcf())
+    plt.clf()
+
+elif page == "🗺️ Карта цен":
+    st.title("Карта цен по станциям метро")
+    st.markdown("""
+Объявления привязаны к координатам своей станции метро и разложены по сетке.
+Медианы по ячейкам и группировка объявлений по станциям считаются один раз
+на версию данных, поэтому карта и запросы по радиусу работают быстро.
+    """)
+    cell_km = st.select_slider("Размер ячейки сетки, км", options=[0.5, 1.0, 2.0, 3.0], value=1.0)
+    layer = get_spatial_layer(df, cell_km=cell_km, version=data_version)
+    grid = layer["grid"]
+
+    fig, ax = plt.subplots(figsize=(8, 8))
+    points = ax.scatter(grid["lon"], grid["lat"], c=grid["median_price_per_sqm"], s=20 + grid["count"] * 5,
+                        cmap="coolwarm", marker="s", alpha=0.8)
+    fig.colorbar(points, ax=ax, label="Медиана цены за м², ₽")
+    ax.set_title("Медианная цена за м² по ячейкам сетки")
+    ax.set_xlabel("Долгота")
+    ax.set_ylabel("Широта")
+    st.pyplot(fig)
+    plt.close(fig)
+
+    if layer["unmatched"]:
+        st.caption(f"Станции без координат в справочнике: {', '.join(layer['unmatched'])}")
+
+    st.subheader("Запрос по радиусу")
+    stations = layer["stations"][layer["stations"]["count"] > 0].sort_values("name")
+    center = st.selectbox("Центр поиска (станция)", stations["name"])
+    radius = st.slider("Радиус, км", 0.5, 10.0, 1.0, step=0.5)
+    lat, lon = stations.loc[stations["name"] == center, ["lat", "lon"]].iloc[0]
+    summary = radius_summary(df, lat, lon, radius, cell_km=cell_km, version=data_version)
+    cols = st.columns(len(summary))
+    for col, (name, value) in zip(cols, summary.items()):
+        col.metric(name, value)
+    st.dataframe(nearest_stations(layer, lat, lon, k=10))
+
 elif page == "📌 Выводы и рекомендации":
     st.title("Выводы и рекомендации")
     st.markdown("""
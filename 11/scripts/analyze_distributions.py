@@ -2,6 +2,9 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+import density_plots
+from history import select_period
+
 
 def calculate_additional_columns(df: pd.DataFrame) -> pd.DataFrame:
     """Добавляет расчетные признаки на основе существующих."""
@@ -49,16 +52,27 @@ def analyze_numeric_column(df: pd.DataFrame, column: str) -> dict:
     }
 
 
-def plot_distribution(df: pd.DataFrame, column: str, title_ru: str):
-    """Строит гистограмму и boxplot по колонке."""
+def plot_distribution(df: pd.DataFrame, column: str, title_ru: str, reduce: bool = True):
+    """
+    Строит гистограмму и boxplot по колонке.
+
+    При reduce=True гистограмма, KDE и статистики boxplot считаются заранее
+    (см. density_plots), поэтому время построения не зависит от числа строк.
+    """
     series = df[column].dropna()
     fig, axes = plt.subplots(1, 2, figsize=(12, 4))
 
-    sns.histplot(series, ax=axes[0], kde=True, bins=30)
+    if reduce:
+        density_plots.histplot(series, ax=axes[0], bins=30)
+    else:
+        sns.histplot(series, ax=axes[0], kde=True, bins=30)
     axes[0].set_title(f"Гистограмма: {title_ru}")
     axes[0].set_xlabel(title_ru)
 
-    sns.boxplot(x=series, ax=axes[1])
+    if reduce:
+        density_plots.boxplot(series, ax=axes[1])
+    else:
+        sns.boxplot(x=series, ax=axes[1])
     axes[1].set_title(f"Boxplot: {title_ru}")
     axes[1].set_xlabel(title_ru)
 
@@ -66,11 +80,13 @@ def plot_distribution(df: pd.DataFrame, column: str, title_ru: str):
     plt.show()
 
 
-def analyze_all(df: pd.DataFrame, columns: dict):
+def analyze_all(df: pd.DataFrame, columns: dict, as_of=None, period=None):
     """
     Проводит анализ всех заданных колонок и выводит округлённую статистику и графики.
+
+    as_of / period — выборка из журнала истории на дату или за период.
     """
-    df = calculate_additional_columns(df)
+    df = calculate_additional_columns(select_period(df, as_of, period))
 
     for col, title in columns.items():
         print(f"\n=== Анализ признака: {title} ({col}) ===")
@@ -1,7 +1,10 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from collections import Counter
+
+import compact  # регистрирует аксессор Series.lists
+from bootstrap import bootstrap_groups, column_groups, item_groups
+from history import select_period
 
 # Русские названия признаков
 feature_names = {
@@ -22,8 +25,13 @@ feature_names = {
 }
 
 
-def analyze_numeric_corr(df: pd.DataFrame, columns: list, target: str = "price"):
-    """Анализирует корреляции с целевой переменной и строит только тепловую карту."""
+def analyze_numeric_corr(df: pd.DataFrame, columns: list, target: str = "price", as_of=None, period=None):
+    """
+    Анализирует корреляции с целевой переменной и строит только тепловую карту.
+
+    as_of / period — выборка из журнала истории на дату или за период (см. history.select_period).
+    """
+    df = select_period(df, as_of, period)
     corr_matrix = df[[target] + columns].corr()
     renamed = {k: feature_names.get(k, k) for k in [target] + columns}
     corr_matrix = corr_matrix.rename(index=renamed, columns=renamed)
@@ -37,9 +45,20 @@ def analyze_numeric_corr(df: pd.DataFrame, columns: list, target: str = "price")
     plt.show()
 
 
-def analyze_categorical_impact(df: pd.DataFrame, column: str, target: str = "price"):
-    """Анализирует категориальный признак по средней цене. Показывает топ и при необходимости — антитоп."""
-    grouped = df.groupby(column)[target].mean().sort_values(ascending=False)
+def analyze_categorical_impact(df: pd.DataFrame, column: str, target: str = "price", as_of=None, period=None,
+                               ci: bool = False, n_resamples: int = 10_000):
+    """
+    Анализирует категориальный признак по средней цене. Показывает топ и при необходимости — антитоп.
+
+    При ci=True к средним добавляются бутстреп-интервалы и перестановочные p-значения (см. bootstrap).
+    """
+    df = select_period(df, as_of, period)
+    grouped = df.groupby(column, observed=True)[target].mean().sort_values(ascending=False)
+    if ci:
+        table = bootstrap_groups(column_groups(df, column, target), pooled=df[target].to_numpy(dtype=float),
+                                 n_resamples=n_resamples)
+        # Группы без значений target бутстреп пропускает — у них остаются пропуски
+        grouped = table.reindex(grouped.index)
     n = len(grouped)
     display_n = min(n, 10)
 
@@ -53,17 +72,23 @@ def analyze_categorical_impact(df: pd.DataFrame, column: str, target: str = "pri
         print(f"\nАНТИТОП 10 по средней цене:")
         print(grouped.tail(10).round(2))
 
+    return grouped
 
-def analyze_list_column_impact(df: pd.DataFrame, column: str, target: str = "price", top_n: int = 10, min_count: int = 5):
+
+def analyze_list_column_impact(df: pd.DataFrame, column: str, target: str = "price", top_n: int = 10, min_count: int = 5,
+                               as_of=None, period=None, ci: bool = False, n_resamples: int = 10_000):
     """
     Анализирует списковые признаки (amenities, tags, building_info) по ТОЧНЫМ совпадениям.
+
+    При ci=True для топа добавляются бутстреп-интервалы и перестановочные p-значения
+    (объявления с элементом против всей выборки).
     """
+    df = select_period(df, as_of, period)
     print(f"\n=== Анализ по: {column} ===")
 
     # Подсчёт частоты отдельных значений
-    exploded = df[column].dropna().explode()
-    freq = Counter(exploded)
-    common_items = [item for item, count in freq.items() if count >= min_count]
+    freq = df[column].dropna().lists.counts()
+    common_items = freq[freq >= min_count].index.tolist()
 
     print(f"Всего признаков с частотой ≥ {min_count}: {len(common_items)}\n")
 
@@ -73,7 +98,7 @@ def analyze_list_column_impact(df: pd.DataFrame, column: str, target: str = "pri
 
     results = {}
     for item in common_items:
-        mask = df[column].apply(lambda x: item in x if isinstance(x, list) else False)
+        mask = df[column].lists.contains(item)
         if mask.sum() == 0:
             continue
         mean_price = df.loc[mask, target].mean()
@@ -86,7 +111,11 @@ def analyze_list_column_impact(df: pd.DataFrame, column: str, target: str = "pri
 
     sorted_means = pd.Series(results).sort_values(ascending=False)
     top_items = sorted_means.head(min(top_n, len(sorted_means)))
+    if ci:
+        top_items = bootstrap_groups(item_groups(df, column, top_items.index.tolist(), target),
+                                     pooled=df[target].to_numpy(dtype=float), n_resamples=n_resamples)
 
     print(f"ТОП {len(top_items)} по средней цене:")
     print(top_items.round(2))
 
+    return top_items
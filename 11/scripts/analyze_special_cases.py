@@ -2,12 +2,21 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import ast
+from IPython.display import display
 
+from bootstrap import bootstrap_groups, column_groups
+import density_plots
+from dedup import collapse_duplicates
+from history import select_period
+from locations import attach_locations
+from ranking import top_k_masked
 
-def prepare_dataframe(df: pd.DataFrame) -> pd.DataFrame:
-    """Десериализует списки и добавляет цену за м²."""
+
+def prepare_dataframe(df: pd.DataFrame, locations_path=None) -> pd.DataFrame:
+    """Десериализует списки, подключает справочник локаций и добавляет цену за м²."""
     for col in ["amenities", "tags", "building_info"]:
         df[col] = df[col].apply(lambda x: ast.literal_eval(x) if isinstance(x, str) else x)
+    df = attach_locations(df, locations_path)
     df["price_per_sqm"] = df["price"] / df["square_meters"]
     return df
 
@@ -27,8 +36,14 @@ def build_period(year):
         return None
 
 
-def analyze_by_build_decade(df: pd.DataFrame):
-    """Анализ по эпохам постройки."""
+def analyze_by_build_decade(df: pd.DataFrame, as_of=None, period=None, ci: bool = False, n_resamples: int = 10_000):
+    """
+    Анализ по эпохам постройки (as_of / period — выборка из журнала истории).
+
+    При ci=True в сводку добавляются бутстреп-интервалы средней цены и
+    перестановочные p-значения, а на графике — отрезки интервалов.
+    """
+    df = select_period(df, as_of, period)
     df["build_decade"] = df["build_year"].apply(build_period)
     df_valid = df[df["build_decade"].notna()]  # убираем неуказанные
 
@@ -43,9 +58,19 @@ def analyze_by_build_decade(df: pd.DataFrame):
         .round(2)
         .reindex([p for p in order if p in df_valid["build_decade"].unique()])
     )
+    if ci:
+        intervals = bootstrap_groups(column_groups(df_valid, "build_decade"), pooled=df_valid["price"].to_numpy(dtype=float),
+                                     n_resamples=n_resamples)
+        summary = summary.join(intervals[["ci_low", "ci_high", "p_value"]].round(4))
 
     plt.figure(figsize=(10, 4))
     sns.barplot(data=summary.reset_index(), x="build_decade", y="avg_price")
+    if ci:
+        plt.errorbar(
+            range(len(summary)), summary["avg_price"],
+            yerr=[summary["avg_price"] - summary["ci_low"], summary["ci_high"] - summary["avg_price"]],
+            fmt="none", ecolor="black", capsize=4,
+        )
     plt.title("Средняя цена аренды по эпохам постройки")
     plt.ylabel("Цена, ₽")
     plt.xticks(rotation=45)
@@ -55,11 +80,20 @@ def analyze_by_build_decade(df: pd.DataFrame):
     return summary
 
 
-def analyze_price_by_location(df: pd.DataFrame):
-    """Анализ средней цены по метро и адресу — таблицы + графики."""
+def analyze_price_by_location(df: pd.DataFrame, dedup: bool = False, as_of=None, period=None):
+    """
+    Анализ средней цены по метро и адресу — таблицы + графики.
+
+    При dedup=True почти-дубликаты (одинаковый cluster_id) учитываются один раз.
+    as_of / period — выборка из журнала истории на дату или за период.
+    """
+    df = select_period(df, as_of, period)
+    if dedup:
+        df = collapse_duplicates(df)
+
     # Группировка
-    metro_df = df.groupby("metro")["price"].mean().dropna().sort_values(ascending=False).head(20).round(2)
-    address_df = df.groupby("address")["price"].mean().dropna().sort_values(ascending=False).head(20).round(2)
+    metro_df = df.groupby("metro", observed=True)["price"].mean().dropna().nlargest(20).round(2)
+    address_df = df.groupby("address", observed=True)["price"].mean().dropna().nlargest(20).round(2)
 
     # Табличный вывод
     metro_table = pd.DataFrame(metro_df).rename(columns={"price": "avg_price"})
@@ -90,8 +124,13 @@ def analyze_price_by_location(df: pd.DataFrame):
     )
 
 
-def analyze_price_per_sqm(df: pd.DataFrame):
-    """Анализ цены за квадратный метр."""
+def analyze_price_per_sqm(df: pd.DataFrame, as_of=None, period=None, reduce: bool = True):
+    """
+    Анализ цены за квадратный метр (as_of / period — выборка из журнала истории).
+
+    reduce=True — гистограмма и KDE по предвычисленным счётчикам (см. density_plots).
+    """
+    df = select_period(df, as_of, period)
     valid = df[df["price_per_sqm"].notna()]
     stats = valid["price_per_sqm"].describe().round(2)
 
@@ -106,24 +145,27 @@ def analyze_price_per_sqm(df: pd.DataFrame):
     print(f"Ст. отклонение: {stats['std']} ₽/м²")
 
     plt.figure(figsize=(10, 4))
-    sns.histplot(valid["price_per_sqm"], bins=40, kde=True)
+    if reduce:
+        density_plots.histplot(valid["price_per_sqm"], ax=plt.gca(), bins=40)
+    else:
+        sns.histplot(valid["price_per_sqm"], bins=40, kde=True)
     plt.title("Распределение цены за квадратный метр")
     plt.xlabel("Цена за м², ₽")
     plt.tight_layout()
     plt.show()
 
-    top5 = valid.sort_values("price_per_sqm", ascending=False).head(5)
-    display(top5[["price", "square_meters", "price_per_sqm", "address", "metro"]].round(2))
-
+    # Разовый запрос: частичная сортировка дешевле построения ранжирующего индекса
+    top5 = df.iloc[top_k_masked(df, "price_per_sqm", 5)]
     top5_table = top5[["price", "square_meters", "price_per_sqm", "address", "metro"]]
+    display(top5_table.round(2))
     return stats, top5_table
 
 
-def find_smallest_most_expensive(df: pd.DataFrame):
+def find_smallest_most_expensive(df: pd.DataFrame, as_of=None, period=None):
     """Находит наименьшую квартиру с наибольшей ценой за м²."""
-    filtered = df[(df["square_meters"] > 0) & (df["price_per_sqm"].notna())]
-    idx = filtered["price_per_sqm"].idxmax()
-    row = filtered.loc[idx]
+    df = select_period(df, as_of, period)
+    positions = top_k_masked(df, "price_per_sqm", 1, mask=(df["square_meters"] > 0).to_numpy())
+    row = df.iloc[positions[0]]
 
     print("\nСамая дорогая (за м²) и маленькая квартира:")
     print(f"Площадь: {row['square_meters']} м²")
@@ -0,0 +1,101 @@
+import ast
+import hashlib
+import json
+import pickle
+from pathlib import Path
+
+import pandas as pd
+
+# Общая папка для производных артефактов (кэш стадий, индексы, отчёты)
+DATA_DIR = Path(__file__).parent.parent / "data"
+CACHE_DIR = DATA_DIR / "cache"
+SCRIPTS_DIR = Path(__file__).resolve().parent
+
+
+def file_hash(path, chunk_size: int = 1 << 20) -> str:
+    """Возвращает sha256 содержимого файла или пустую строку, если файла нет."""
+    path = Path(path)
+    if not path.exists():
+        return ""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def local_imports(path) -> set:
+    """Модули из папки scripts, которые файл импортирует (включая импорты внутри функций)."""
+    names = set()
+    for node in ast.walk(ast.parse(Path(path).read_bytes())):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names.add(node.module.split(".")[0])
+    return {SCRIPTS_DIR / f"{name}.py" for name in names} & set(SCRIPTS_DIR.glob("*.py"))
+
+
+def module_files(*modules) -> list:
+    """Файлы переданных модулей и всех локальных модулей, которые они импортируют транзитивно."""
+    pending = [Path(module.__file__).resolve() for module in modules]
+    seen = set()
+    while pending:
+        path = pending.pop()
+        if path in seen:
+            continue
+        seen.add(path)
+        if path.parent == SCRIPTS_DIR:
+            pending.extend(local_imports(path) - seen)
+    return sorted(seen)
+
+
+def code_version(*modules) -> str:
+    """
+    Хэш исходного кода переданных модулей и их локальных зависимостей.
+
+    Меняется при любой правке функций, в том числе в модулях, которые
+    импортируются не напрямую (ranking, bootstrap, dedup и т. п.).
+    """
+    digest = hashlib.sha256()
+    for path in module_files(*modules):
+        digest.update(path.name.encode("utf-8"))
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def combine_hashes(*parts) -> str:
+    """Склеивает несколько хэшей/параметров в один ключ."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(json.dumps(part, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def frame_hash(df: pd.DataFrame, columns: list = None) -> str:
+    """
+    Версия датасета в памяти: хэш содержимого выбранных колонок.
+
+    Списковые колонки хэшируются через строковое представление.
+    """
+    cols = columns if columns is not None else list(df.columns)
+    hashable = df[cols].copy()
+    for col in cols:
+        if hashable[col].dtype == object:
+            hashable[col] = hashable[col].map(lambda x: repr(x) if isinstance(x, (list, tuple)) else x)
+    row_hashes = pd.util.hash_pandas_object(hashable, index=True).values
+    return hashlib.sha256(row_hashes.tobytes() + ",".join(map(str, cols)).encode("utf-8")).hexdigest()
+
+
+def load_pickle(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def save_pickle(obj, path):
+    """Атомарно сохраняет объект: пишет во временный файл и переименовывает."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "wb") as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    tmp.replace(path)
@@ -0,0 +1,156 @@
+"""
+Бутстреп-доверительные интервалы и перестановочные p-значения для групповых средних.
+
+Для каждой группы (станция метро, эпоха постройки, элемент списка удобств)
+считаются:
+- доверительный интервал средней цены — перцентильный бутстреп: все
+  повторные выборки группы строятся одной матрицей индексов;
+- p-значение перестановочного теста «среднее группы отличается от остальных».
+  Разность средних группы и остальных линейна по среднему случайного
+  подмножества того же размера, поэтому достаточно распределения средних
+  случайных подмножеств. Они берутся блоками из перемешанных строк
+  матрицы общей выборки — каждый блок является равномерной выборкой без
+  возвращения.
+
+Группы считаются в пуле процессов; зерно группы выводится из общего зерна и
+названия группы, поэтому результат группы не зависит ни от числа процессов,
+ни от того, какие ещё группы считаются вместе с ней. Это позволяет
+пересчитывать только группы, значения которых изменились (group_fingerprints).
+"""
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import compact  # регистрирует аксессор Series.lists
+
+# Ограничение размера одной матрицы выборок (число элементов)
+MAX_ELEMENTS = 1 << 22
+
+
+def _bootstrap_means(values: np.ndarray, n_resamples: int, rng) -> np.ndarray:
+    """Средние n_resamples бутстреп-выборок (порциями по MAX_ELEMENTS)."""
+    m = len(values)
+    means = np.empty(n_resamples)
+    rows = max(1, MAX_ELEMENTS // m)
+    for start in range(0, n_resamples, rows):
+        r = min(rows, n_resamples - start)
+        means[start:start + r] = values[rng.integers(0, m, size=(r, m))].mean(axis=1)
+    return means
+
+
+def _subset_means(pooled: np.ndarray, m: int, n_resamples: int, rng) -> np.ndarray:
+    """Средние n_resamples случайных подмножеств размера m без возвращения."""
+    n = len(pooled)
+    blocks = n // m
+    rows_needed = -(-n_resamples // blocks)
+    rows = max(1, MAX_ELEMENTS // n)
+    parts = []
+    for start in range(0, rows_needed, rows):
+        r = min(rows, rows_needed - start)
+        shuffled = rng.permuted(np.broadcast_to(pooled, (r, n)), axis=1)
+        parts.append(shuffled[:, :blocks * m].reshape(r, blocks, m).mean(axis=2).ravel())
+    return np.concatenate(parts)[:n_resamples]
+
+
+def _group_stats(values: np.ndarray, pooled: np.ndarray, seed, n_resamples: int, confidence: float) -> dict:
+    rng = np.random.default_rng(seed)
+    m, mean = len(values), values.mean()
+    alpha = (1 - confidence) / 2
+    ci_low, ci_high = np.quantile(_bootstrap_means(values, n_resamples, rng), [alpha, 1 - alpha])
+
+    if m >= len(pooled):
+        p_value = 1.0
+    else:
+        center = pooled.mean()
+        null = _subset_means(pooled, m, n_resamples, rng)
+        extreme = np.count_nonzero(np.abs(null - center) >= abs(mean - center) * (1 - 1e-12))
+        p_value = (extreme + 1) / (n_resamples + 1)
+    return {"count": m, "mean": mean, "ci_low": ci_low, "ci_high": ci_high, "p_value": p_value}
+
+
+def _group_seed(seed: int, label) -> np.random.SeedSequence:
+    """Зерно группы: общее зерно + хэш названия группы."""
+    digest = hashlib.sha256(str(label).encode("utf-8")).digest()
+    return np.random.SeedSequence([seed, int.from_bytes(digest[:8], "little")])
+
+
+def _run_chunk(labels, arrays, seeds, pooled, n_resamples, confidence) -> list:
+    return [
+        (label, _group_stats(values, pooled, seed, n_resamples, confidence))
+        for label, values, seed in zip(labels, arrays, seeds)
+    ]
+
+
+def bootstrap_groups(groups: dict, pooled: np.ndarray = None, n_resamples: int = 10_000,
+                     confidence: float = 0.95, seed: int = 0, workers: int = None) -> pd.DataFrame:
+    """
+    Доверительные интервалы средних и перестановочные p-значения по группам.
+
+    Args:
+        groups: {название группы: массив значений} (пропуски отбрасываются)
+        pooled: вся выборка для перестановочного теста; по умолчанию — объединение групп
+        n_resamples: число бутстреп-выборок и перестановок на группу
+        confidence: уровень доверия интервала
+        seed: зерно; зерно группы — SeedSequence из него и названия группы
+        workers: число процессов (1 — без пула)
+
+    Returns:
+        pd.DataFrame: count, mean, ci_low, ci_high, p_value по группам
+    """
+    groups = {label: np.asarray(values, dtype=float) for label, values in groups.items()}
+    groups = {label: values[~np.isnan(values)] for label, values in groups.items()}
+    groups = {label: values for label, values in groups.items() if len(values)}
+    columns = ["count", "mean", "ci_low", "ci_high", "p_value"]
+    if not groups:
+        return pd.DataFrame(columns=columns)
+
+    if pooled is None:
+        pooled = np.concatenate(list(groups.values()))
+    pooled = np.asarray(pooled, dtype=float)
+    pooled = pooled[~np.isnan(pooled)]
+
+    labels = list(groups)
+    seeds = [_group_seed(seed, label) for label in labels]
+    workers = min(workers or os.cpu_count() or 1, len(labels))
+
+    if workers == 1:
+        results = _run_chunk(labels, [groups[label] for label in labels], seeds, pooled, n_resamples, confidence)
+    else:
+        # Крупные группы раскладываем по задачам по очереди, чтобы выровнять нагрузку
+        order = sorted(range(len(labels)), key=lambda i: -len(groups[labels[i]]))
+        chunks = [order[i::workers * 4] for i in range(workers * 4)]
+        results = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(_run_chunk, [labels[i] for i in chunk], [groups[labels[i]] for i in chunk],
+                            [seeds[i] for i in chunk], pooled, n_resamples, confidence)
+                for chunk in chunks if chunk
+            ]
+            for future in futures:
+                results.extend(future.result())
+
+    table = pd.DataFrame.from_dict(dict(results), orient="index", columns=columns)
+    return table.reindex(labels)
+
+
+def group_fingerprints(groups: dict) -> dict:
+    """Хэш значений каждой группы: по нему видно, какие группы нужно пересчитать."""
+    return {
+        label: hashlib.sha256(np.ascontiguousarray(values, dtype=float).tobytes()).hexdigest()
+        for label, values in groups.items()
+    }
+
+
+def column_groups(df: pd.DataFrame, column: str, target: str = "price") -> dict:
+    """Значения target по категориям column (без пропусков в категории)."""
+    grouped = df.groupby(column, observed=True)[target]
+    return {label: pd.to_numeric(values, errors="coerce").to_numpy() for label, values in grouped}
+
+
+def item_groups(df: pd.DataFrame, column: str, items: list, target: str = "price") -> dict:
+    """Значения target у объявлений, в списке column которых есть элемент (группы пересекаются)."""
+    values = pd.to_numeric(df[target], errors="coerce").to_numpy()
+    return {item: values[df[column].lists.contains(item).to_numpy()] for item in items}
@@ -1,6 +1,9 @@
 import re
 import pandas as pd
 import ast
+from pathlib import Path
+
+from locations import register_locations
 
 
 def extract_price(value):
@@ -34,6 +37,9 @@ def clean_rent_offer_data(input_path: str, output_path: str):
     df["ceiling_height"] = None
     df["floor"] = None
     df["build_year"] = None
+    # Откуда взят год постройки и год из technical_info — для сверки источников при проверке данных
+    df["build_year_source"] = None
+    df["build_year_tech"] = None
     df["building_floors"] = None
     df["apartments_count"] = None
     df["entrances_count"] = None
@@ -65,6 +71,8 @@ def clean_rent_offer_data(input_path: str, output_path: str):
             elif "год постройки" in item:
                 match = re.search(r"\d{4}", item)
                 df.at[i, "build_year"] = int(match.group(0)) if match else None
+                df.at[i, "build_year_tech"] = df.at[i, "build_year"]
+                df.at[i, "build_year_source"] = "technical_info" if match else None
             else:
                 tech_remaining.append(item)
 
@@ -74,6 +82,7 @@ def clean_rent_offer_data(input_path: str, output_path: str):
                 match = re.search(r"\b(19|20)\d{2}\b", item)
                 if match:
                     df.at[i, "build_year"] = int(match.group(0))
+                    df.at[i, "build_year_source"] = "building_info"
             elif "этажей" in item:
                 match = re.search(r"(\d+)", item)
                 df.at[i, "building_floors"] = int(match.group(1)) if match else None
@@ -107,6 +116,10 @@ def clean_rent_offer_data(input_path: str, output_path: str):
     # Удаление технической информации после обработки
     df.drop(columns=["technical_info"], inplace=True)
 
+    # Справочник локаций (стабильные ID канонических metro/address) сохраняется рядом
+    # с результатом; в самой таблице остаются строки
+    register_locations(df, path=Path(output_path).parent / "locations.csv")
+
     # Сохранение
     df.to_csv(output_path, index=False)
     print(f"Данные сохранены в: {output_path}")
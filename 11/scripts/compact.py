@@ -0,0 +1,358 @@
+"""
+Компактное представление датафрейма объявлений в памяти.
+
+После prepare_dataframe каждая строка хранит три Python-списка Python-строк
+(удобства, теги, информация о доме) и object-колонки, поэтому большая часть
+памяти уходит на накладные расходы объектов. Компактный режим:
+
+- понижает разрядность числовых колонок без потери значений;
+- переводит строковые колонки с небольшим числом значений в category,
+  остальные — в строки pyarrow;
+- хранит списковые колонки как «рваные» массивы: смещения строк плюс
+  целочисленные коды элементов по общему словарю колонки.
+
+Списковые колонки остаются обычными колонками pandas (ExtensionArray):
+элемент — по-прежнему список строк, explode/apply/dropna работают как раньше.
+Для векторных операций есть аксессор Series.lists.
+"""
+import sys
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+from pandas.api.extensions import (
+    ExtensionArray,
+    ExtensionDtype,
+    register_extension_dtype,
+    register_series_accessor,
+)
+from pandas.api.indexers import check_array_indexer
+from pandas.api.types import infer_dtype, is_bool_dtype, is_float_dtype, is_integer_dtype, pandas_dtype
+
+LIST_COLUMNS = ["amenities", "tags", "building_info"]
+
+# Разделители для строкового представления списка (хэширование, factorize)
+_LENGTH_SEP, _ITEM_SEP = "\x1e", "\x1f"
+
+
+@register_extension_dtype
+class ListDtype(ExtensionDtype):
+    """Тип колонки со списками строк, хранящимися в RaggedArray."""
+
+    name = "ragged_list"
+    type = list
+    na_value = np.nan
+
+    @classmethod
+    def construct_array_type(cls):
+        return RaggedArray
+
+
+def _encode_key(items) -> str:
+    """Строковый ключ списка: длина и элементы через служебные разделители."""
+    return f"{len(items)}{_LENGTH_SEP}{_ITEM_SEP.join(items)}"
+
+
+def _decode_key(key: str) -> list:
+    length, items = key.split(_LENGTH_SEP, 1)
+    return items.split(_ITEM_SEP) if int(length) else []
+
+
+def _code_dtype(n: int):
+    return np.int16 if n < np.iinfo(np.int16).max else np.int32
+
+
+class RaggedArray(ExtensionArray):
+    """
+    Массив списков: offsets (длина n + 1), codes (элементы всех списков подряд)
+    и vocab (уникальные строки). Список строки i — vocab[codes[offsets[i]:offsets[i + 1]]].
+    """
+
+    def __init__(self, offsets: np.ndarray, codes: np.ndarray, vocab: np.ndarray, mask: np.ndarray = None):
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.codes = codes
+        self.vocab = vocab
+        self._mask = np.zeros(len(self.offsets) - 1, dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+
+    # --- построение ---
+
+    @classmethod
+    def _from_sequence(cls, scalars, *, dtype=None, copy=False):
+        if isinstance(scalars, cls):
+            return scalars.copy() if copy else scalars
+        values = list(scalars)
+        is_list = np.array([isinstance(x, (list, tuple, np.ndarray)) for x in values], dtype=bool)
+        lists = [x if ok else () for x, ok in zip(values, is_list)]
+        lengths = np.fromiter(map(len, lists), dtype=np.int64, count=len(lists))
+        flat = np.array(list(chain.from_iterable(lists)), dtype=object)
+
+        # Пропуски внутри списков не храним
+        keep = pd.notna(flat)
+        if not keep.all():
+            rows = np.repeat(np.arange(len(lists)), lengths)
+            flat = flat[keep]
+            lengths = np.bincount(rows[keep], minlength=len(lists))
+
+        codes, vocab = pd.factorize(flat)
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        return cls(offsets, codes.astype(_code_dtype(len(vocab))), np.asarray(vocab, dtype=object), ~is_list)
+
+    @classmethod
+    def _from_factorized(cls, values, original):
+        return cls._from_sequence([None if value is None else _decode_key(value) for value in values])
+
+    # --- интерфейс ExtensionArray ---
+
+    @property
+    def dtype(self):
+        return ListDtype()
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def nbytes(self):
+        vocab_bytes = sum(sys.getsizeof(item) for item in self.vocab)
+        return self.offsets.nbytes + self.codes.nbytes + self._mask.nbytes + vocab_bytes
+
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    def _row_list(self, i: int):
+        if self._mask[i]:
+            return self.dtype.na_value
+        return self.vocab[self.codes[self.offsets[i]:self.offsets[i + 1]]].tolist()
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return self._row_list(int(key) + len(self) if key < 0 else int(key))
+        if isinstance(key, slice):
+            return self._gather(np.arange(len(self))[key])
+        key = check_array_indexer(self, key)
+        if is_bool_dtype(key.dtype):
+            key = np.flatnonzero(key)
+        return self._gather(np.arange(len(self))[key])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._row_list(i)
+
+    def _gather(self, positions: np.ndarray) -> "RaggedArray":
+        """Новый массив из строк positions (с копированием их элементов)."""
+        positions = np.asarray(positions, dtype=np.int64)
+        lengths = self.lengths()[positions]
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        # Индекс каждого элемента в исходном codes: начало исходной строки + сдвиг внутри неё
+        source = np.repeat(self.offsets[positions] - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return type(self)(offsets, self.codes[source], self.vocab, self._mask[positions])
+
+    def take(self, indices, allow_fill: bool = False, fill_value=None):
+        indices = np.asarray(indices, dtype=np.int64)
+        if not allow_fill:
+            return self._gather(np.arange(len(self))[indices])
+        if fill_value is not None and not pd.isna(fill_value):
+            raise ValueError("RaggedArray поддерживает заполнение только пропусками")
+        if (indices < -1).any():
+            raise ValueError("Недопустимый индекс для take с allow_fill=True")
+        fill = indices == -1
+        if len(self) == 0:
+            if not fill.all():
+                raise IndexError("Нельзя взять непустые индексы из пустого массива")
+            return type(self)(np.zeros(len(indices) + 1), self.codes[:0], self.vocab, np.ones(len(indices), dtype=bool))
+        result = self._gather(np.where(fill, 0, indices))
+        result._mask = result._mask | fill
+        # У заполненных строк списка нет — обнуляем их длину
+        lengths = np.where(fill, 0, result.lengths())
+        keep = np.repeat(~fill, result.lengths())
+        return type(self)(np.concatenate([[0], np.cumsum(lengths)]), result.codes[keep], self.vocab, result._mask)
+
+    def copy(self):
+        return type(self)(self.offsets.copy(), self.codes.copy(), self.vocab, self._mask.copy())
+
+    def isna(self):
+        return self._mask.copy()
+
+    @classmethod
+    def _concat_same_type(cls, to_concat):
+        to_concat = list(to_concat)
+        vocab = pd.Index(np.concatenate([arr.vocab for arr in to_concat])).unique()
+        codes = [vocab.get_indexer(arr.vocab)[arr.codes] if len(arr.codes) else arr.codes for arr in to_concat]
+        lengths = np.concatenate([arr.lengths() for arr in to_concat])
+        return cls(
+            np.concatenate([[0], np.cumsum(lengths)]),
+            np.concatenate(codes).astype(_code_dtype(len(vocab))),
+            np.asarray(vocab, dtype=object),
+            np.concatenate([arr._mask for arr in to_concat]),
+        )
+
+    def _values_for_factorize(self):
+        values = np.empty(len(self), dtype=object)
+        for i in range(len(self)):
+            if not self._mask[i]:
+                values[i] = _encode_key(self.vocab[self.codes[self.offsets[i]:self.offsets[i + 1]]])
+        return values, None
+
+    def __eq__(self, other):
+        values, _ = self._values_for_factorize()
+        if isinstance(other, RaggedArray):
+            other_values, _ = other._values_for_factorize()
+            result = values == other_values
+        elif isinstance(other, (list, tuple)):
+            result = values == _encode_key(other)
+        else:
+            result = np.zeros(len(self), dtype=bool)
+        return np.asarray(result, dtype=bool) & ~self._mask
+
+    def __array__(self, dtype=None, copy=None):
+        values = np.empty(len(self), dtype=object)
+        for i in range(len(self)):
+            values[i] = self._row_list(i)
+        return values if dtype is None else values.astype(dtype)
+
+    def astype(self, dtype, copy=True):
+        dtype = pandas_dtype(dtype)
+        if isinstance(dtype, ListDtype):
+            return self.copy() if copy else self
+        values = self.__array__()
+        if isinstance(dtype, ExtensionDtype):
+            return dtype.construct_array_type()._from_sequence(values, dtype=dtype, copy=False)
+        return values.astype(dtype)
+
+    def _explode(self):
+        """Элементы всех списков как Categorical по словарю (пустой список → пропуск)."""
+        lengths = self.lengths()
+        counts = np.maximum(lengths, 1)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        codes = np.full(counts.sum(), -1, dtype=self.codes.dtype)
+        within = np.arange(self.offsets[-1]) - np.repeat(self.offsets[:-1], lengths)
+        codes[np.repeat(starts, lengths) + within] = self.codes
+        return pd.Categorical.from_codes(codes, categories=self.vocab), counts
+
+    def __arrow_array__(self, type=None):
+        import pyarrow as pa
+
+        items = pa.DictionaryArray.from_arrays(
+            pa.array(self.codes.astype(np.int32)), pa.array(self.vocab, type=pa.string())
+        ).cast(pa.string())
+        return pa.ListArray.from_arrays(pa.array(self.offsets.astype(np.int32)), items, mask=pa.array(self._mask))
+
+
+@register_series_accessor("lists")
+class ListAccessor:
+    """
+    Векторные операции со списковой колонкой: df["amenities"].lists.contains("Wi-Fi").
+
+    Работает и для компактных (RaggedArray), и для обычных object-колонок со списками.
+    """
+
+    def __init__(self, series: pd.Series):
+        self._series = series
+
+    @property
+    def _ragged(self):
+        array = self._series.array
+        return array if isinstance(array, RaggedArray) else None
+
+    def contains(self, item) -> pd.Series:
+        """Маска строк, в списке которых есть item."""
+        ragged = self._ragged
+        if ragged is None:
+            values = self._series.map(lambda x: item in x if isinstance(x, list) else False)
+            return values.astype(bool)
+        mask = np.zeros(len(ragged), dtype=bool)
+        hits = np.flatnonzero(ragged.vocab == item)
+        if len(hits):
+            rows = np.repeat(np.arange(len(ragged)), ragged.lengths())
+            mask[rows[ragged.codes == hits[0]]] = True
+        return pd.Series(mask, index=self._series.index, name=self._series.name)
+
+    def lengths(self) -> pd.Series:
+        """Длина списка в каждой строке (0 для пропусков)."""
+        ragged = self._ragged
+        if ragged is None:
+            values = self._series.map(lambda x: len(x) if isinstance(x, list) else 0)
+        else:
+            values = ragged.lengths()
+        return pd.Series(values, index=self._series.index, name=self._series.name).astype(np.int32)
+
+    def counts(self) -> pd.Series:
+        """Частоты элементов по всем спискам, по убыванию."""
+        ragged = self._ragged
+        if ragged is None:
+            return self._series.explode().dropna().value_counts()
+        counts = pd.Series(np.bincount(ragged.codes, minlength=len(ragged.vocab)), index=ragged.vocab, name="count")
+        return counts[counts > 0].sort_values(ascending=False, kind="stable")
+
+    def to_lists(self) -> pd.Series:
+        """Обычная object-колонка со списками (например, для сохранения в CSV)."""
+        return pd.Series(np.asarray(self._series.array, dtype=object), index=self._series.index, name=self._series.name)
+
+
+def _downcast_numeric(series: pd.Series) -> pd.Series:
+    """Наименьший тип, в котором все значения колонки сохраняются без изменений."""
+    values = series.to_numpy()
+    if is_float_dtype(series.dtype):
+        finite = values[~np.isnan(values)]
+        if len(finite) == len(values) and len(values) and np.array_equal(finite, np.round(finite)):
+            return pd.to_numeric(series, downcast="integer")
+        as_float32 = values.astype(np.float32)
+        if np.array_equal(as_float32.astype(values.dtype), values, equal_nan=True):
+            return series.astype(np.float32)
+        return series
+    return pd.to_numeric(series, downcast="integer")
+
+
+def compact_frame(df: pd.DataFrame, list_columns: list = None, max_category_ratio: float = 0.5) -> pd.DataFrame:
+    """
+    Компактная копия датафрейма.
+
+    Args:
+        df: объявления после prepare_dataframe (+ calculate_additional_columns)
+        list_columns: списковые колонки для перевода в RaggedArray
+        max_category_ratio: строковая колонка становится category, если уникальных
+            значений не больше этой доли от числа строк
+    """
+    list_columns = LIST_COLUMNS if list_columns is None else list_columns
+    columns = {}
+    for col in df.columns:
+        series = df[col]
+        if col in list_columns and series.dtype == object:
+            series = pd.Series(RaggedArray._from_sequence(series), index=df.index, name=col)
+        elif is_bool_dtype(series.dtype):
+            pass
+        elif is_integer_dtype(series.dtype) or is_float_dtype(series.dtype):
+            if isinstance(series.dtype, np.dtype):
+                series = _downcast_numeric(series)
+        elif series.dtype == object and infer_dtype(series, skipna=True) in ("string", "empty"):
+            if series.nunique() <= max_category_ratio * len(series):
+                series = series.astype("category")
+            else:
+                series = series.astype(pd.StringDtype("pyarrow"))
+        columns[col] = series
+    return pd.DataFrame(columns, index=df.index)
+
+
+def frame_memory(df: pd.DataFrame) -> pd.Series:
+    """
+    Память колонок в байтах.
+
+    В отличие от memory_usage(deep=True), для object-колонок со списками
+    учитываются и строки внутри списков.
+    """
+    usage = df.memory_usage(deep=True, index=False)
+    for col in df.columns:
+        if df[col].dtype == object:
+            nested = sum(
+                sum(map(sys.getsizeof, value)) for value in df[col] if isinstance(value, (list, tuple))
+            )
+            usage[col] += nested
+    return usage
+
+
+def memory_report(before: pd.Series, after: pd.Series) -> pd.DataFrame:
+    """Таблица «до/после» по колонкам (МБ) с коэффициентом сжатия и итоговой строкой."""
+    report = pd.DataFrame({"до, МБ": before, "после, МБ": after.reindex(before.index)})
+    report.loc["Итого"] = report.sum()
+    report["сжатие, раз"] = (report["до, МБ"] / report["после, МБ"]).round(1)
+    report[["до, МБ", "после, МБ"]] = (report[["до, МБ", "после, МБ"]] / 2**20).round(2)
+    return report
@@ -0,0 +1,150 @@
+"""
+Поиск похожих объявлений (k ближайших соседей).
+
+Каждое объявление описывается вектором: стандартизованные площадь, позиция
+по этажности и год постройки, one-hot отделки и multi-hot самых частых
+удобств. По векторам один раз на версию датасета строится KD-дерево, после
+чего запросы (в том числе пакетные) выполняются за миллисекунды. Повторные
+публикации той же квартиры (общий cluster_id из dedup) соседями не считаются.
+"""
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from artifacts import frame_hash
+
+NUMERIC_FEATURES = ["square_meters", "floors_diff", "build_year"]
+# Веса групп признаков: площадь важнее всего, удобства — слабее
+WEIGHTS = {"square_meters": 2.0, "floors_diff": 1.0, "build_year": 1.0, "renovation_type": 1.0, "amenities": 0.5}
+VERSION_COLUMNS = [
+    "link", "price", "square_meters", "floors_diff", "build_year", "renovation_type", "amenities", "cluster_id",
+]
+
+_INDEX_CACHE = {}
+
+
+def _feature_matrix(df: pd.DataFrame, spec: dict) -> np.ndarray:
+    """Вектор признаков для каждой строки по спецификации индекса."""
+    blocks = []
+    for col in NUMERIC_FEATURES:
+        mean, std = spec["scaling"][col]
+        values = (pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float) - mean) / std
+        values[~np.isfinite(values)] = 0.0
+        blocks.append(WEIGHTS[col] * values[:, None])
+
+    renovation = pd.Categorical(df["renovation_type"], categories=spec["renovations"])
+    blocks.append(WEIGHTS["renovation_type"] * np.eye(len(spec["renovations"]) + 1)[renovation.codes + 1][:, 1:])
+
+    # Удобства: каждое несовпадение немного увеличивает расстояние
+    exploded = df["amenities"].reset_index(drop=True).explode().dropna()
+    codes = pd.Categorical(exploded, categories=spec["amenities"]).codes
+    amen = np.zeros((len(df), len(spec["amenities"])))
+    valid = codes >= 0
+    amen[exploded.index.to_numpy()[valid], codes[valid]] = 1.0
+    blocks.append(WEIGHTS["amenities"] * amen)
+    return np.hstack(blocks)
+
+
+def build_index(df: pd.DataFrame, top_amenities: int = 30) -> dict:
+    """
+    Строит KD-дерево по подготовленным объявлениям.
+
+    Args:
+        df: объявления после prepare_dataframe + calculate_additional_columns
+        top_amenities: сколько самых частых удобств включать в вектор
+    """
+    scaling = {}
+    for col in NUMERIC_FEATURES:
+        values = pd.to_numeric(df[col], errors="coerce")
+        std = values.std()
+        scaling[col] = (values.mean(), std if std and np.isfinite(std) else 1.0)
+    spec = {
+        "scaling": scaling,
+        "renovations": sorted(df["renovation_type"].dropna().unique()),
+        "amenities": df["amenities"].explode().dropna().value_counts().head(top_amenities).index.tolist(),
+    }
+    X = _feature_matrix(df, spec)
+
+    # Кластеры почти-дубликатов (-1 — кластер не посчитан) и размер самого крупного
+    clusters = np.full(len(df), -1, dtype="int64")
+    if "cluster_id" in df.columns:
+        cluster_id = pd.to_numeric(df["cluster_id"], errors="coerce").to_numpy(dtype=float)
+        known = ~np.isnan(cluster_id)
+        clusters[known] = cluster_id[known].astype("int64")
+    known_clusters = clusters[clusters >= 0]
+    max_cluster = int(np.unique(known_clusters, return_counts=True)[1].max()) if len(known_clusters) else 1
+    return {"tree": cKDTree(X), "X": X, "spec": spec, "index": df.index, "clusters": clusters, "max_cluster": max_cluster}
+
+
+def get_index(df: pd.DataFrame, version: str = None) -> dict:
+    """
+    Индекс для текущей версии датасета (строится один раз на версию).
+
+    version — ключ версии, посчитанный один раз при загрузке; без него версия
+    определяется хэшем колонок (проход по всем строкам на каждый запрос).
+    """
+    if version is None:
+        version = frame_hash(df, [c for c in VERSION_COLUMNS if c in df.columns])
+    if version not in _INDEX_CACHE:
+        _INDEX_CACHE.clear()
+        _INDEX_CACHE[version] = build_index(df)
+    return _INDEX_CACHE[version]
+
+
+def batch_comparables(df: pd.DataFrame, positions, k: int = 10, version: str = None):
+    """
+    k ближайших объявлений для нескольких объявлений сразу.
+
+    Args:
+        positions: позиции (iloc) объявлений-запросов
+        version: ключ версии датасета (см. get_index)
+
+    Returns:
+        (distances, neighbours): массивы формы (len(positions), k); само
+        объявление и его повторные публикации (тот же cluster_id) в результат
+        не входят
+    """
+    index = get_index(df, version)
+    positions = np.atleast_1d(positions)
+    # Запас на исключаемые строки: не больше размера самого крупного кластера
+    k_query = min(k + max(index["max_cluster"], 1), len(df))
+    distances, neighbours = index["tree"].query(index["X"][positions], k=k_query)
+    distances, neighbours = np.atleast_2d(distances), np.atleast_2d(neighbours)
+
+    # Убираем само объявление (оно может оказаться не первым при равных расстояниях)
+    # и объявления из его кластера — иначе дубликаты приходят с нулевым расстоянием
+    clusters = index["clusters"]
+    own = clusters[positions][:, None]
+    keep = (neighbours != positions[:, None]) & ((own < 0) | (clusters[neighbours] != own))
+    found = min(k, int(keep.sum(axis=1).min())) if len(keep) else 0
+    distances = np.array([row[mask][:found] for row, mask in zip(distances, keep)])
+    neighbours = np.array([row[mask][:found] for row, mask in zip(neighbours, keep)])
+    return distances, neighbours
+
+
+def query_comparables(df: pd.DataFrame, offers: pd.DataFrame, k: int = 10, version: str = None):
+    """k ближайших объявлений из df для произвольных (в том числе новых) объявлений offers."""
+    index = get_index(df, version)
+    return index["tree"].query(_feature_matrix(offers, index["spec"]), k=min(k, len(df)))
+
+
+def find_comparables(df: pd.DataFrame, label, k: int = 10, version: str = None) -> pd.DataFrame:
+    """Таблица k похожих объявлений для объявления с индексом label."""
+    position = df.index.get_loc(label)
+    distances, neighbours = batch_comparables(df, [position], k=k, version=version)
+    result = df.iloc[neighbours[0]][
+        ["price", "square_meters", "floor", "build_year", "renovation_type", "address", "metro", "link"]
+    ].copy()
+    result.insert(0, "distance", distances[0].round(3))
+    return result
+
+
+def price_spread(comparables: pd.DataFrame) -> dict:
+    """Разброс цен похожих объявлений."""
+    prices = comparables["price"].dropna()
+    return {
+        "Минимум": prices.min(),
+        "Медиана": prices.median(),
+        "Среднее": round(prices.mean(), 2),
+        "Максимум": prices.max(),
+    }
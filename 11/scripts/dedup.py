@@ -0,0 +1,243 @@
+"""
+Поиск почти-дубликатов объявлений (MinHash + LSH).
+
+Одна и та же квартира часто публикуется повторно под другим ID оффера, поэтому
+удаление дубликатов по ссылке их не ловит. Для каждого объявления строится
+множество признаков (адрес, метро, этаж, площадь, удобства, информация о доме),
+из него — MinHash-подпись. Подписи раскладываются по корзинам LSH, и только
+пары из общих корзин проверяются точным коэффициентом Жаккара. Этаж и площадь
+— лишь пара токенов из нескольких десятков, поэтому кандидаты в дубликаты
+дополнительно должны совпадать по этажу и площади (с допуском AREA_TOLERANCE).
+Время работы почти линейно по числу объявлений.
+"""
+import numpy as np
+import pandas as pd
+
+from artifacts import CACHE_DIR
+
+CLUSTERS_PATH = CACHE_DIR / "clusters.csv"
+
+SCALAR_FIELDS = ["address", "metro", "floor"]
+LIST_FIELDS = ["amenities", "building_info"]
+
+# Допустимое относительное расхождение общей площади у дубликатов
+AREA_TOLERANCE = 0.05
+
+# Простое число Мерсенна для универсального хэширования
+_PRIME = np.uint64((1 << 61) - 1)
+_MASK32 = np.uint64(0xFFFFFFFF)
+
+
+def _scalar_tokens(df: pd.DataFrame):
+    """Токены скалярных признаков: (номер строки, строка-токен)."""
+    rows, tokens = [], []
+    positions = np.arange(len(df))
+    for col in SCALAR_FIELDS:
+        # Для закодированных локаций используем целочисленный код
+        source = df[f"{col}_id"] if f"{col}_id" in df.columns else df[col] if col in df.columns else None
+        if source is None:
+            continue
+        valid = source.notna().values
+        if f"{col}_id" in df.columns:
+            valid &= (source.values != -1)
+        rows.append(positions[valid])
+        tokens.append((col + ":" + source[valid].astype(str)).values)
+    if "square_meters" in df.columns:
+        sqm = pd.to_numeric(df["square_meters"], errors="coerce")
+        valid = sqm.notna().values
+        rows.append(positions[valid])
+        tokens.append(("sqm:" + sqm[valid].round().astype(int).astype(str)).values)
+    return rows, tokens
+
+
+def _list_tokens(df: pd.DataFrame):
+    """Токены списковых признаков: каждый элемент списка — отдельный токен."""
+    rows, tokens = [], []
+    for col in LIST_FIELDS:
+        if col not in df.columns:
+            continue
+        exploded = df[col].reset_index(drop=True).explode().dropna()
+        rows.append(exploded.index.values)
+        tokens.append((col + ":" + exploded.astype(str)).values)
+    return rows, tokens
+
+
+def token_hashes(df: pd.DataFrame):
+    """
+    Хэши уникальных токенов объявлений в плоском виде.
+
+    Returns:
+        (row_ids, hashes): отсортированные по номеру строки массивы; у каждой
+        строки есть хотя бы один токен (пустые получают уникальный токен).
+    """
+    rows_s, tokens_s = _scalar_tokens(df)
+    rows_l, tokens_l = _list_tokens(df)
+    row_ids = np.concatenate(rows_s + rows_l) if rows_s + rows_l else np.array([], dtype=np.int64)
+    tokens = np.concatenate(tokens_s + tokens_l) if tokens_s + tokens_l else np.array([], dtype=object)
+    hashes = pd.util.hash_array(tokens.astype(object))
+
+    # Строки без токенов не должны слипаться друг с другом
+    empty = np.setdiff1d(np.arange(len(df)), row_ids)
+    row_ids = np.concatenate([row_ids, empty]).astype(np.int64)
+    hashes = np.concatenate([hashes, pd.util.hash_array(("empty:" + pd.Series(empty).astype(str)).values)])
+
+    pairs = pd.DataFrame({"row": row_ids, "hash": hashes}).drop_duplicates().sort_values(["row", "hash"])
+    return pairs["row"].values, pairs["hash"].values
+
+
+def minhash_signatures(row_ids, hashes, n_rows: int, num_perm: int = 64, seed: int = 0,
+                       chunk_tokens: int = 1_000_000) -> np.ndarray:
+    """
+    MinHash-подписи формы (n_rows, num_perm).
+
+    Перестановки моделируются функциями (a·h + b) mod p; минимум по токенам
+    каждой строки считается через np.minimum.reduceat. Токены обрабатываются
+    порциями, чтобы промежуточная матрица не росла вместе с данными.
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 1 << 31, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, 1 << 31, size=num_perm, dtype=np.uint64)
+    h32 = hashes & _MASK32
+
+    signatures = np.full((n_rows, num_perm), np.iinfo(np.uint64).max, dtype=np.uint64)
+    for start in range(0, len(h32), chunk_tokens):
+        chunk_rows = row_ids[start:start + chunk_tokens]
+        values = (h32[start:start + chunk_tokens, None] * a + b) % _PRIME
+        boundaries = np.flatnonzero(np.r_[True, chunk_rows[1:] != chunk_rows[:-1]])
+        mins = np.minimum.reduceat(values, boundaries, axis=0)
+        rows = chunk_rows[boundaries]
+        signatures[rows] = np.minimum(signatures[rows], mins)
+    return signatures
+
+
+def lsh_candidate_pairs(signatures: np.ndarray, bands: int = 16, max_bucket: int = 50) -> np.ndarray:
+    """
+    Пары-кандидаты из общих корзин LSH.
+
+    Подпись делится на bands полос; строки с одинаковой полосой попадают в одну
+    корзину. В небольших корзинах берутся все пары, в больших — пары с первым
+    элементом корзины, чтобы число кандидатов оставалось линейным.
+    """
+    n, num_perm = signatures.shape
+    rows_per_band = num_perm // bands
+    positions = np.arange(n)
+    found = []
+    for band in range(bands):
+        part = signatures[:, band * rows_per_band:(band + 1) * rows_per_band]
+        keys = pd.util.hash_pandas_object(pd.DataFrame(part), index=False).values
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        new_bucket = np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]
+        bucket = np.cumsum(new_bucket) - 1
+        sizes = np.bincount(bucket)
+        if sizes.max() < 2:
+            continue
+        first = np.flatnonzero(new_bucket)[bucket]
+        small = sizes[bucket] <= max_bucket
+
+        # Все пары в малых корзинах: элементы на расстоянии d в отсортированном порядке
+        max_small = sizes[sizes <= max_bucket].max(initial=1)
+        for d in range(1, max_small):
+            same = (bucket[d:] == bucket[:-d]) & small[d:]
+            found.append(np.column_stack([order[:-d][same], order[d:][same]]))
+
+        # Большие корзины: «звезда» вокруг первого элемента
+        star = ~small & (positions != first)
+        found.append(np.column_stack([order[first[star]], order[star]]))
+    if not found:
+        return np.empty((0, 2), dtype=np.int64)
+    pairs = np.sort(np.concatenate(found), axis=1)
+    return np.unique(pairs, axis=0)
+
+
+def _jaccard(pairs: np.ndarray, row_ids: np.ndarray, hashes: np.ndarray, n_rows: int) -> np.ndarray:
+    """Точный коэффициент Жаккара для пар по множествам хэшей токенов."""
+    offsets = np.searchsorted(row_ids, np.arange(n_rows + 1))
+    involved = np.unique(pairs)
+    sets = {r: set(hashes[offsets[r]:offsets[r + 1]].tolist()) for r in involved}
+    scores = np.empty(len(pairs))
+    for k, (i, j) in enumerate(pairs):
+        a, b = sets[i], sets[j]
+        scores[k] = len(a & b) / len(a | b)
+    return scores
+
+
+def _same_flat(pairs: np.ndarray, df: pd.DataFrame, area_tolerance: float = AREA_TOLERANCE) -> np.ndarray:
+    """
+    Маска пар с одинаковым этажом и близкой общей площадью.
+
+    Пропуск совпадает только с пропуском: объявление без этажа не склеивается
+    с объявлением, где этаж указан.
+    """
+    same = np.ones(len(pairs), dtype=bool)
+    for col in ["floor", "square_meters"]:
+        if col not in df.columns:
+            continue
+        values = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float)
+        a, b = values[pairs[:, 0]], values[pairs[:, 1]]
+        if col == "floor":
+            close = a == b
+        else:
+            close = np.abs(a - b) <= area_tolerance * np.fmax(a, b)
+        same &= close | (np.isnan(a) & np.isnan(b))
+    return same
+
+
+def _connected_components(n: int, pairs: np.ndarray) -> np.ndarray:
+    """Компоненты связности (система непересекающихся множеств)."""
+    parent = np.arange(n)
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for i, j in pairs:
+        ri, rj = find(i), find(j)
+        if ri != rj:
+            parent[max(ri, rj)] = min(ri, rj)
+    return np.array([find(x) for x in range(n)])
+
+
+def find_near_duplicates(df: pd.DataFrame, threshold: float = 0.8, num_perm: int = 64,
+                         bands: int = 16, seed: int = 0) -> pd.Series:
+    """
+    Назначает объявлениям идентификаторы кластеров почти-дубликатов.
+
+    Args:
+        df: обработанные объявления (списки уже десериализованы)
+        threshold: минимальный коэффициент Жаккара для склейки пары (кроме того,
+            у пары должны совпадать этаж и площадь, см. _same_flat)
+        num_perm: длина MinHash-подписи
+        bands: число полос LSH (num_perm должно делиться на bands)
+        seed: зерно для хэш-функций
+
+    Returns:
+        pd.Series: cluster_id (номер первой строки кластера) с индексом df
+    """
+    if len(df) == 0:
+        return pd.Series(dtype="int64", index=df.index, name="cluster_id")
+
+    row_ids, hashes = token_hashes(df)
+    signatures = minhash_signatures(row_ids, hashes, len(df), num_perm=num_perm, seed=seed)
+    candidates = lsh_candidate_pairs(signatures, bands=bands)
+    if len(candidates):
+        candidates = candidates[_same_flat(candidates, df)]
+    if len(candidates):
+        candidates = candidates[_jaccard(candidates, row_ids, hashes, len(df)) >= threshold]
+    clusters = _connected_components(len(df), candidates)
+    return pd.Series(clusters, index=df.index, name="cluster_id")
+
+
+def collapse_duplicates(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Оставляет по одному объявлению на кластер (если cluster_id посчитан).
+
+    Объявления без cluster_id (появились после последнего запуска дедупликации)
+    остаются все.
+    """
+    if "cluster_id" not in df.columns:
+        return df
+    cluster = df["cluster_id"]
+    return df[cluster.isna().to_numpy() | ~cluster.duplicated().to_numpy()]
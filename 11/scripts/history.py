@@ -0,0 +1,258 @@
+"""
+История обработанных объявлений, разбитая по датам обхода.
+
+Каждый обход сохраняется в отдельную партицию
+data/history/crawl_date=YYYY-MM-DD/changes.parquet, куда попадают только
+новые, изменившиеся и снятые с публикации объявления (ключ — ID оффера из
+ссылки). Объём хранилища растёт с числом изменений, а не снимков.
+
+Первый обход каждого месяца дополнительно сохраняет контрольный снимок —
+полное состояние активных объявлений на эту дату
+(data/history/checkpoint=YYYY-MM-DD/state.parquet). Запросы на дату или за
+период (load_history) читают последний снимок не позже начала периода и
+партиции после него, поэтому их стоимость не растёт с длиной истории.
+"""
+import json
+import re
+import shutil
+from datetime import date, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+HISTORY_DIR = Path(__file__).parent.parent / "data" / "history"
+PARTITION_PREFIX = "crawl_date="
+CHECKPOINT_PREFIX = "checkpoint="
+SERVICE_COLUMNS = ["offer_id", "crawl_date", "change_type", "row_hash"]
+
+
+def offer_id(links: pd.Series) -> pd.Series:
+    """ID оффера из ссылки вида https://realty.yandex.ru/offer/<id>/."""
+    return links.astype(str).str.extract(r"/offer/(\d+)", expand=False).fillna(links.astype(str))
+
+
+def _row_hash(df: pd.DataFrame) -> pd.Series:
+    """Хэш атрибутов объявления (всё, кроме ссылки и служебных колонок)."""
+    cols = [c for c in df.columns if c not in SERVICE_COLUMNS + ["link"]]
+    return pd.util.hash_pandas_object(df[cols].astype(str), index=False).astype(str)
+
+
+def _to_date(value) -> date:
+    return pd.Timestamp(value).date()
+
+
+def _list_dates(history_dir, prefix: str, filename: str) -> list:
+    history_dir = Path(history_dir or HISTORY_DIR)
+    if not history_dir.exists():
+        return []
+    dates = []
+    for path in history_dir.iterdir():
+        match = re.fullmatch(prefix + r"(\d{4}-\d{2}-\d{2})", path.name)
+        if match and (path / filename).exists():
+            dates.append(date.fromisoformat(match.group(1)))
+    return sorted(dates)
+
+
+def list_partitions(history_dir=None) -> list:
+    """Даты всех сохранённых обходов по возрастанию."""
+    return _list_dates(history_dir, PARTITION_PREFIX, "changes.parquet")
+
+
+def list_checkpoints(history_dir=None) -> list:
+    """Даты контрольных снимков по возрастанию."""
+    return _list_dates(history_dir, CHECKPOINT_PREFIX, "state.parquet")
+
+
+def load_changes(start=None, end=None, columns: list = None, history_dir=None) -> pd.DataFrame:
+    """
+    Читает журнал изменений за период [start, end] (границы включительно).
+
+    Партиции вне периода не открываются.
+    """
+    history_dir = Path(history_dir or HISTORY_DIR)
+    start = _to_date(start) if start is not None else None
+    end = _to_date(end) if end is not None else None
+    selected = [
+        d for d in list_partitions(history_dir)
+        if (start is None or d >= start) and (end is None or d <= end)
+    ]
+    frames = [
+        pd.read_parquet(history_dir / f"{PARTITION_PREFIX}{d.isoformat()}" / "changes.parquet", columns=columns)
+        for d in selected
+    ]
+    if not frames:
+        return pd.DataFrame(columns=columns or SERVICE_COLUMNS)
+    changes = pd.concat(frames, ignore_index=True)
+    if "crawl_date" in changes.columns:
+        changes["crawl_date"] = pd.to_datetime(changes["crawl_date"])
+    return changes
+
+
+def _latest(df: pd.DataFrame, mask) -> pd.DataFrame:
+    """Последняя запись каждого объявления среди строк журнала по маске."""
+    return df[mask].sort_values("crawl_date", kind="stable").drop_duplicates("offer_id", keep="last")
+
+
+def _prepare(df: pd.DataFrame) -> pd.DataFrame:
+    """Те же преобразования, что и при загрузке processed_offers.csv (списки, локации, производные колонки)."""
+    from analyze_distributions import calculate_additional_columns
+    from analyze_special_cases import prepare_dataframe
+
+    return calculate_additional_columns(prepare_dataframe(df.reset_index(drop=True)))
+
+
+def load_history(end=None, start=None, columns: list = None, history_dir=None) -> pd.DataFrame:
+    """
+    Журнал, достаточный для состояний на любую дату из [start, end].
+
+    Читаются последний контрольный снимок не позже start (без start — не
+    позже end) и партиции после него до end включительно. Результат можно
+    передавать в select_period и функции анализа вместо load_changes().
+    """
+    history_dir = Path(history_dir or HISTORY_DIR)
+    anchor = start if start is not None else end
+    checkpoints = [d for d in list_checkpoints(history_dir) if anchor is None or d <= _to_date(anchor)]
+    if not checkpoints:
+        return load_changes(end=end, columns=columns, history_dir=history_dir)
+
+    checkpoint = checkpoints[-1]
+    state = pd.read_parquet(history_dir / f"{CHECKPOINT_PREFIX}{checkpoint.isoformat()}" / "state.parquet",
+                            columns=columns)
+    if "crawl_date" in state.columns:
+        state["crawl_date"] = pd.to_datetime(state["crawl_date"])
+    changes = load_changes(start=checkpoint + timedelta(days=1), end=end, columns=columns, history_dir=history_dir)
+    return pd.concat([state, changes], ignore_index=True) if len(changes) else state
+
+
+def select_period(df: pd.DataFrame, as_of=None, period=None, prepare: bool = True) -> pd.DataFrame:
+    """
+    Оставляет состояние объявлений на дату или за период.
+
+    Args:
+        df: журнал изменений (результат load_changes)
+        as_of: дата — последнее известное состояние каждого объявления на эту дату
+        period: (начало, конец) — объявления, активные хотя бы в один из дней
+            периода: состояние на начало периода с применёнными изменениями
+            внутри него; снятые за период — в последнем состоянии до снятия
+        prepare: подготовить выборку как processed_offers.csv (prepare_dataframe
+            и производные колонки); False — для журнала только со служебными колонками
+
+    Без as_of и period датафрейм возвращается без изменений.
+    """
+    if as_of is None and period is None:
+        return df
+    if "crawl_date" not in df.columns:
+        raise ValueError("Выборка по дате требует журнал изменений из history.load_changes()")
+
+    crawl_dates = pd.to_datetime(df["crawl_date"])
+    active = df["change_type"] != "removed"
+    if as_of is not None:
+        view = _latest(df, crawl_dates <= pd.Timestamp(as_of))
+        view = view[view["change_type"] != "removed"]
+    else:
+        start, end = pd.Timestamp(period[0]), pd.Timestamp(period[1])
+        at_start = _latest(df, crawl_dates <= start)
+        at_start = at_start.loc[at_start["change_type"] != "removed", "offer_id"]
+        touched = df.loc[active & (crawl_dates >= start) & (crawl_dates <= end), "offer_id"]
+        view = _latest(df, active & (crawl_dates <= end))
+        view = view[view["offer_id"].isin(at_start) | view["offer_id"].isin(touched)]
+    return _prepare(view) if prepare else view.copy()
+
+
+def snapshot_as_of(as_of, history_dir=None) -> pd.DataFrame:
+    """Состояние всех активных объявлений на дату (снимок и партиции после него)."""
+    return select_period(load_history(end=as_of, history_dir=history_dir), as_of=as_of)
+
+
+def record_crawl(processed_path, crawl_date=None, history_dir=None) -> dict:
+    """
+    Сохраняет обход как партицию изменений относительно предыдущих обходов.
+
+    Повторная запись той же даты заменяет партицию; контрольные снимки с этой
+    даты и позже удаляются (они строились по старым данным). Первый обход
+    месяца сохраняет новый контрольный снимок.
+
+    Returns:
+        dict: число новых, изменившихся и снятых объявлений
+    """
+    history_dir = Path(history_dir or HISTORY_DIR)
+    crawl_date = _to_date(crawl_date or date.today())
+
+    df = pd.read_csv(processed_path)
+    df.insert(0, "offer_id", offer_id(df["link"]))
+    df = df.drop_duplicates("offer_id", keep="last")
+    df["row_hash"] = _row_hash(df)
+
+    # Предыдущее состояние: только служебные колонки из партиций до этой даты
+    for checkpoint in list_checkpoints(history_dir):
+        if checkpoint >= crawl_date:
+            shutil.rmtree(history_dir / f"{CHECKPOINT_PREFIX}{checkpoint.isoformat()}")
+    day_before = crawl_date - timedelta(days=1)
+    previous = load_history(end=day_before, columns=SERVICE_COLUMNS, history_dir=history_dir)
+    previous = select_period(previous, as_of=day_before, prepare=False) if len(previous) else previous
+    known = dict(zip(previous["offer_id"], previous["row_hash"]))
+
+    old_hash = df["offer_id"].map(known)
+    is_new = old_hash.isna()
+    is_changed = ~is_new & (old_hash != df["row_hash"])
+    changes = df[is_new | is_changed].copy()
+    changes["change_type"] = is_changed[is_new | is_changed].map({True: "changed", False: "new"})
+
+    removed_ids = sorted(set(known) - set(df["offer_id"]))
+    removed = pd.DataFrame({"offer_id": removed_ids, "change_type": "removed"})
+    changes = pd.concat([changes, removed], ignore_index=True)
+    changes["crawl_date"] = pd.Timestamp(crawl_date)
+
+    partition = history_dir / f"{PARTITION_PREFIX}{crawl_date.isoformat()}"
+    partition.mkdir(parents=True, exist_ok=True)
+    changes.to_parquet(partition / "changes.parquet", index=False)
+    if not any((d.year, d.month) == (crawl_date.year, crawl_date.month) for d in list_checkpoints(history_dir)):
+        _write_checkpoint(history_dir, crawl_date)
+
+    counts = {
+        "crawl_date": crawl_date.isoformat(),
+        "new": int(is_new.sum()),
+        "changed": int(is_changed.sum()),
+        "removed": len(removed_ids),
+        "rows": len(df),
+    }
+    _update_manifest(history_dir, counts)
+    print(f"Обход {counts['crawl_date']}: новых {counts['new']}, изменилось {counts['changed']}, "
+          f"снято {counts['removed']}")
+    return counts
+
+
+def _write_checkpoint(history_dir: Path, checkpoint: date):
+    """Сохраняет полное состояние активных объявлений на дату как контрольный снимок."""
+    state = select_period(load_history(end=checkpoint, history_dir=history_dir), as_of=checkpoint, prepare=False)
+    path = history_dir / f"{CHECKPOINT_PREFIX}{checkpoint.isoformat()}"
+    path.mkdir(parents=True, exist_ok=True)
+    state.to_parquet(path / "state.parquet", index=False)
+
+
+def _update_manifest(history_dir: Path, counts: dict):
+    """Список партиций с числом изменений — по нему удобно отслеживать новые обходы."""
+    path = history_dir / "manifest.json"
+    manifest = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {"partitions": []}
+    partitions = [p for p in manifest["partitions"] if p["crawl_date"] != counts["crawl_date"]]
+    manifest["partitions"] = sorted(partitions + [counts], key=lambda p: p["crawl_date"])
+    path.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+def price_movement(start, end, by: str = "metro", history_dir=None) -> pd.DataFrame:
+    """
+    Изменение средней цены по группам между двумя датами.
+
+    Сравниваются состояния на start и на end; читаются контрольный снимок
+    не позже start и партиции после него до end.
+    """
+    changes = load_history(end=end, start=start, history_dir=history_dir)
+    before = select_period(changes, as_of=start)
+    after = select_period(changes, as_of=end)
+    summary = pd.DataFrame({
+        "price_before": before.groupby(by, observed=True)["price"].mean(),
+        "price_after": after.groupby(by, observed=True)["price"].mean(),
+        "count_after": after.groupby(by, observed=True)["price"].count(),
+    })
+    summary["change_pct"] = (summary["price_after"] / summary["price_before"] - 1) * 100
+    return summary.round(2).sort_values("change_pct", ascending=False)
@@ -0,0 +1,175 @@
+"""
+Инкрементальная подгрузка свежих данных в работающий дашборд.
+
+Состояние держит подготовленный датафрейм и хэши исходных строк по ссылке.
+refresh_state сравнивает время изменения и размер processed_offers.csv и
+справочника локаций с запомненными; если файл обновился, он читается заново,
+но prepare_dataframe, производные колонки и сжатие применяются только к новым
+и изменившимся строкам. Снятые объявления удаляются, остальные строки
+датафрейма не пересчитываются.
+
+Кластеры почти-дубликатов берутся из результата стадии dedup конвейера
+(cluster_id по ссылке); у объявлений, появившихся после её запуска, cluster_id
+пустой. Если файл кластеров обновился, колонка переназначается целиком.
+"""
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from analyze_distributions import calculate_additional_columns
+from artifacts import combine_hashes
+from analyze_special_cases import prepare_dataframe
+from compact import compact_frame, frame_memory, memory_report
+from dedup import CLUSTERS_PATH
+
+
+def file_signature(*paths) -> tuple:
+    """(mtime_ns, размер) каждого файла; None для отсутствующих."""
+    signature = []
+    for path in paths:
+        path = Path(path)
+        if path.exists():
+            stat = path.stat()
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        else:
+            signature.append(None)
+    return tuple(signature)
+
+
+def _row_hashes(raw: pd.DataFrame) -> pd.Series:
+    """Хэш исходной строки CSV по ссылке объявления."""
+    return pd.Series(pd.util.hash_pandas_object(raw, index=False).to_numpy(), index=raw["link"].to_numpy())
+
+
+def _load_clusters(path) -> pd.Series:
+    """cluster_id по ссылке из результата стадии dedup (пустой, если её не запускали)."""
+    path = Path(path)
+    if not path.exists():
+        return pd.Series(dtype="Int64")
+    clusters = pd.read_csv(path)
+    return pd.Series(clusters["cluster_id"].to_numpy(), index=clusters["link"].to_numpy()).astype("Int64")
+
+
+def _attach_clusters(df: pd.DataFrame, clusters: pd.Series) -> pd.DataFrame:
+    """Колонка cluster_id по ссылке объявления."""
+    df["cluster_id"] = pd.array(df["link"].map(clusters), dtype="Int64")
+    return df
+
+
+def _derive(raw: pd.DataFrame, state: dict) -> pd.DataFrame:
+    """Подготовка строк так же, как при полной загрузке."""
+    df = prepare_dataframe(raw.copy(), locations_path=state["locations_path"])
+    df = calculate_additional_columns(df)
+    df = compact_frame(df) if state["compact"] else df
+    return _attach_clusters(df, state["clusters"])
+
+
+def _append(base: pd.DataFrame, added: pd.DataFrame) -> pd.DataFrame:
+    """
+    Дописывает строки с сохранением типов базового датафрейма.
+
+    Категории объединяются, иначе concat превратил бы колонку в object.
+    """
+    added = added.copy()
+    for col in base.columns.intersection(added.columns):
+        dtype = base[col].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            categories = dtype.categories.union(pd.Index(added[col].dropna().unique()), sort=False)
+            if len(categories) > len(dtype.categories):
+                base[col] = base[col].cat.set_categories(categories)
+            added[col] = pd.Categorical(added[col], categories=categories)
+        elif isinstance(dtype, pd.StringDtype):
+            added[col] = added[col].astype(dtype)
+    return pd.concat([base, added], ignore_index=True)
+
+
+def load_state(path, locations_path=None, compact: bool = True, clusters_path=None) -> dict:
+    """
+    Полная загрузка: датафрейм, хэши строк и подпись файлов.
+
+    Returns:
+        dict: df, frame — пара (df, ключ версии для кэшей индексов, который
+        не требует прохода по строкам; пара заменяется одним присваиванием),
+        memory (отчёт о памяти для компактного режима), version, last_update,
+        changed_rows (сколько строк добавлено, изменено и снято с момента
+        загрузки) и служебные поля для refresh_state
+    """
+    path = Path(path)
+    state = {
+        "path": path,
+        "locations_path": Path(locations_path or path.parent / "locations.csv"),
+        "clusters_path": Path(clusters_path or CLUSTERS_PATH),
+        "compact": compact,
+        "lock": threading.Lock(),
+        "version": 0,
+        "last_update": None,
+        "changed_rows": 0,
+    }
+    state["signature"] = file_signature(path, state["locations_path"], state["clusters_path"])
+    state["clusters"] = _load_clusters(state["clusters_path"])
+    raw = pd.read_csv(path)
+    state["hashes"] = _row_hashes(raw)
+
+    df = calculate_additional_columns(prepare_dataframe(raw, locations_path=state["locations_path"]))
+    state["memory"] = None
+    if compact:
+        # Компактный режим: узкие числовые типы, категории и списки в виде кодов по словарю
+        before = frame_memory(df)
+        df = compact_frame(df)
+        state["memory"] = memory_report(before, frame_memory(df))
+    state["df"] = _attach_clusters(df, state["clusters"])
+    state["frame"] = (df, combine_hashes(str(path), state["signature"], 0))
+    return state
+
+
+def refresh_state(state: dict):
+    """
+    Подтягивает изменения файла в состояние.
+
+    Returns:
+        None, если файл не менялся; иначе dict с числом новых, изменённых и
+        снятых объявлений, подготовленными новыми и изменёнными строками
+        ("rows") и ссылками снятых объявлений ("removed_links")
+    """
+    if file_signature(state["path"], state["locations_path"], state["clusters_path"]) == state["signature"]:
+        return None
+    with state["lock"]:
+        # Пока ждали блокировку, обновление мог применить другой сеанс
+        signature = file_signature(state["path"], state["locations_path"], state["clusters_path"])
+        if signature == state["signature"]:
+            return None
+        if signature[2] != state["signature"][2]:
+            state["clusters"] = _load_clusters(state["clusters_path"])
+        start = time.perf_counter()
+        raw = pd.read_csv(state["path"])
+        hashes = _row_hashes(raw)
+        old = state["hashes"]
+
+        known = hashes.index.isin(old.index)
+        same = known & (hashes.to_numpy() == old.reindex(hashes.index).to_numpy())
+        changed = hashes.index[known & ~same]
+        removed = old.index.difference(hashes.index)
+
+        added = _derive(raw[~same], state)
+        df = state["df"]
+        keep = ~df["link"].isin(changed.append(removed)).to_numpy()
+        df = _append(df[keep].reset_index(drop=True), added)
+        if signature[2] != state["signature"][2]:
+            df = _attach_clusters(df, state["clusters"])
+        state["df"] = df
+        state["hashes"] = hashes
+        state["signature"] = signature
+        state["version"] += 1
+        state["frame"] = (state["df"], combine_hashes(str(state["path"]), signature, state["version"]))
+
+        changes = {
+            "new": int((~known).sum()),
+            "changed": len(changed),
+            "removed": len(removed),
+            "seconds": round(time.perf_counter() - start, 2),
+        }
+        state["changed_rows"] += changes["new"] + changes["changed"] + changes["removed"]
+        state["last_update"] = {**changes, "at": pd.Timestamp.now().strftime("%H:%M:%S")}
+        return {**changes, "rows": added, "removed_links": removed}
@@ -0,0 +1,161 @@
+import re
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Справочник локаций хранится рядом с обработанными данными
+LOCATIONS_PATH = Path(__file__).parent.parent / "data" / "locations.csv"
+LOCATION_COLUMNS = ["metro", "address"]
+
+# Значения-заглушки парсера и пустые строки считаются пропуском
+MISSING_VALUES = {"не найдено", ""}
+
+# Сокращения типов улиц (ключи уже после замены ё → е)
+STREET_TYPES = {
+    "улица": "ул", "ул": "ул",
+    "проспект": "пр-т", "просп": "пр-т", "пр-т": "пр-т",
+    "переулок": "пер", "пер": "пер",
+    "шоссе": "ш", "ш": "ш",
+    "бульвар": "б-р", "бул": "б-р", "б-р": "б-р",
+    "набережная": "наб", "наб": "наб",
+    "площадь": "пл", "пл": "пл",
+    "проезд": "пр-д", "пр-д": "пр-д",
+    "аллея": "ал", "ал": "ал",
+    "тупик": "туп", "туп": "туп",
+    "поселок": "пос", "пос": "пос",
+}
+
+
+@lru_cache(maxsize=None)
+def normalize_location(value):
+    """
+    Приводит название станции или адрес к каноническому ключу.
+
+    Регистр, ё/е, пунктуация, лишние пробелы и порядок слов не важны,
+    типы улиц сокращаются: «улица Арбат» и «Арбат ул.» дают один ключ.
+    Возвращает None для пропусков и заглушки «Не найдено».
+    """
+    if not isinstance(value, str):
+        return None
+    text = value.casefold().replace("ё", "е")
+    text = re.sub(r"\s*[—–]\s*", " ", text)
+    text = re.sub(r"[^\w\s-]", " ", text)
+    tokens = [STREET_TYPES.get(t, t) for t in text.split()]
+    if not tokens or " ".join(tokens) in MISSING_VALUES:
+        return None
+    return " ".join(sorted(tokens))
+
+
+def load_dimension(path=None) -> pd.DataFrame:
+    """Загружает справочник локаций (kind, location_id, key, name) или возвращает пустой."""
+    path = Path(path or LOCATIONS_PATH)
+    if path.exists():
+        return pd.read_csv(path, dtype={"kind": str, "location_id": "int32", "key": str, "name": str})
+    return pd.DataFrame({
+        "kind": pd.Series(dtype=str),
+        "location_id": pd.Series(dtype="int32"),
+        "key": pd.Series(dtype=str),
+        "name": pd.Series(dtype=str),
+    })
+
+
+def _canonical_keys(series: pd.Series) -> pd.Series:
+    """Канонические ключи; нормализатор вызывается один раз на уникальное значение."""
+    uniques = pd.unique(series.dropna())
+    mapping = {raw: normalize_location(raw) for raw in uniques}
+    return series.map(mapping)
+
+
+def update_dimension(df: pd.DataFrame, dim: pd.DataFrame) -> pd.DataFrame:
+    """
+    Дополняет справочник новыми ключами из df.
+
+    Уже выданные ID не меняются; новым ключам выдаются следующие номера.
+    Отображаемое имя — самый частый исходный вариант написания.
+    """
+    new_rows = [dim]
+    for kind in LOCATION_COLUMNS:
+        if kind not in df.columns:
+            continue
+        raw = df[kind]
+        keys = _canonical_keys(raw)
+        known = set(dim.loc[dim["kind"] == kind, "key"])
+        fresh = pd.DataFrame({"key": keys, "raw": raw}).dropna()
+        fresh = fresh[~fresh["key"].isin(known)]
+        if fresh.empty:
+            continue
+        names = (
+            fresh.groupby(["key", "raw"]).size()
+            .sort_values(ascending=False, kind="stable")
+            .reset_index()
+            .drop_duplicates("key")
+            .sort_values("key")
+        )
+        used = dim.loc[dim["kind"] == kind, "location_id"]
+        start = int(used.max()) + 1 if len(used) else 0
+        new_rows.append(pd.DataFrame({
+            "kind": kind,
+            "location_id": np.arange(start, start + len(names), dtype="int32"),
+            "key": names["key"].values,
+            "name": names["raw"].values,
+        }))
+    return pd.concat(new_rows, ignore_index=True)
+
+
+def _assign_ids(df: pd.DataFrame, dim: pd.DataFrame) -> pd.DataFrame:
+    """Добавляет колонки <kind>_id по справочнику; пропуски кодируются как -1."""
+    for kind in LOCATION_COLUMNS:
+        if kind not in df.columns:
+            continue
+        part = dim[dim["kind"] == kind]
+        ids = _canonical_keys(df[kind]).map(dict(zip(part["key"], part["location_id"])))
+        df[f"{kind}_id"] = ids.fillna(-1).astype("int32")
+    return df
+
+
+def register_locations(df: pd.DataFrame, path=None) -> pd.DataFrame:
+    """
+    Дополняет справочник локаций значениями из df и сохраняет его в path.
+
+    Сами metro/address в данных остаются строками: файл данных (и история
+    обходов) не зависит от справочника, справочник только закрепляет ID
+    между запусками. Без него ID выдаются заново в памяти.
+    """
+    dim = update_dimension(df, load_dimension(path))
+    dim.to_csv(path or LOCATIONS_PATH, index=False)
+    return dim
+
+
+def decode_locations(df: pd.DataFrame, path=None, dim: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Добавляет колонки metro/address как категориальные поверх целочисленных кодов.
+
+    Категории упорядочены по ID, поэтому группировки работают по кодам,
+    а не по строкам. ID, которых нет в справочнике (например, файл записан
+    с другим справочником), дают пропуск.
+    """
+    dim = load_dimension(path) if dim is None else dim
+    for kind in LOCATION_COLUMNS:
+        id_col = f"{kind}_id"
+        if id_col not in df.columns:
+            continue
+        part = dim[dim["kind"] == kind].sort_values("location_id")
+        ids = pd.to_numeric(df[id_col], errors="coerce").fillna(-1).astype("int64")
+        codes = pd.Index(part["location_id"].astype("int64")).get_indexer(ids)
+        df[kind] = pd.Categorical.from_codes(codes, categories=part["name"].values)
+    return df
+
+
+def attach_locations(df: pd.DataFrame, path=None) -> pd.DataFrame:
+    """
+    Приводит df с любым представлением локаций к виду «коды + категории».
+
+    Строковые metro/address кодируются в памяти по справочнику (новые
+    значения получают следующие ID), без записи справочника на диск.
+    """
+    if any(col in df.columns and f"{col}_id" not in df.columns for col in LOCATION_COLUMNS):
+        dim = update_dimension(df, load_dimension(path))
+        return decode_locations(_assign_ids(df, dim), dim=dim)
+    return decode_locations(df, path)
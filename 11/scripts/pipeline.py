@@ -0,0 +1,364 @@
+"""
+Конвейер parse → clean → analyze с мемоизацией стадий.
+
+Каждая стадия объявляет зависимости и выходные файлы. Результат стадии
+считается актуальным, если совпадает ключ: хэш содержимого входов + версия кода
+стадии. При повторном запуске пересчитываются только стадии ниже изменившихся
+данных, а независимые стадии одного уровня выполняются параллельно.
+
+Запуск:
+    python scripts/pipeline.py                 # все стадии
+    python scripts/pipeline.py figures         # только figures и её предки
+    python scripts/pipeline.py --force eda     # принудительный пересчёт
+    python scripts/pipeline.py --crawl 16      # заново спарсить 16 страниц
+"""
+import matplotlib
+
+matplotlib.use("Agg")  # стадии выполняются без дисплея
+
+import argparse
+import inspect
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import matplotlib.pyplot as plt
+import pandas as pd
+
+import analyze_distributions
+import analyze_price_factors
+import analyze_special_cases
+import clean_data
+import dedup
+import density_plots
+import eda
+import history
+import locations
+import price_model
+import spatial
+import validate
+from artifacts import CACHE_DIR, DATA_DIR, code_version, combine_hashes, file_hash
+
+MANIFEST_PATH = CACHE_DIR / "manifest.json"
+FIGURES_DIR = CACHE_DIR / "figures"
+AGGREGATES_DIR = CACHE_DIR / "aggregates"
+
+DISTRIBUTION_COLUMNS = list(analyze_price_factors.feature_names)
+CORR_COLUMNS = [c for c in DISTRIBUTION_COLUMNS if c != "price"]
+
+
+@dataclass(frozen=True)
+class Stage:
+    """Описание стадии конвейера."""
+    name: str
+    func: object  # callable(inputs: list[Path], outputs: list[Path]) или None для источника
+    deps: tuple = ()
+    outputs: tuple = ()
+    modules: tuple = field(default=(), compare=False)  # локальные зависимости модулей учитываются автоматически
+
+
+# --- Функции стадий (уровня модуля, чтобы их можно было передать в процесс) ---
+
+def _stage_raw(inputs, outputs, num_pages=2):
+    from parser import collect_rent_offers
+    collect_rent_offers(num_pages=num_pages)
+
+
+def _stage_processed(inputs, outputs):
+    clean_data.clean_rent_offer_data(str(inputs[0]), str(outputs[0]))
+    # Строки с нарушениями правил качества уходят в карантин
+    validate.validate_processed(outputs[0], quarantine_dir=Path(outputs[2]).parent, raw_path=inputs[0])
+
+
+def _stage_history(inputs, outputs):
+    history.record_crawl(inputs[0], history_dir=Path(outputs[0]).parent)
+
+
+def _stage_dedup(inputs, outputs):
+    df = pd.read_csv(inputs[0])
+    df = analyze_special_cases.prepare_dataframe(df, locations_path=inputs[1])
+    clusters = dedup.find_near_duplicates(df)
+    pd.DataFrame({"link": df["link"], "cluster_id": clusters}).to_csv(outputs[0], index=False)
+    print(f"Найдено кластеров почти-дубликатов: {len(df) - clusters.nunique()} лишних объявлений")
+
+
+def _stage_features(inputs, outputs):
+    df = pd.read_csv(inputs[0])
+    df = analyze_special_cases.prepare_dataframe(df, locations_path=inputs[1])
+    df = analyze_distributions.calculate_additional_columns(df)
+    clusters = pd.read_csv(inputs[-1])
+    df["cluster_id"] = df["link"].map(dict(zip(clusters["link"], clusters["cluster_id"])))
+    df.to_pickle(outputs[0])
+
+
+def _stage_price_model(inputs, outputs):
+    df = pd.read_pickle(inputs[0])
+    # Модель другой версии кода load_model не возвращает — она обучается заново
+    model = price_model.load_model(outputs[0])
+    if model is None:
+        model = price_model.fit_price_model(df)
+    else:
+        model = price_model.update_price_model(model, df, complete=True)
+    price_model.save_model(model, outputs[0])
+
+
+def _stage_spatial(inputs, outputs):
+    df = pd.read_pickle(inputs[0])
+    layer = spatial.get_spatial_layer(df)
+    layer["grid"].to_csv(outputs[0], index=False)
+    if layer["unmatched"]:
+        print(f"Станции без координат: {', '.join(layer['unmatched'])}")
+
+
+def _stage_eda(inputs, outputs):
+    eda.run_eda(str(inputs[0])).to_csv(outputs[0], index=False)
+
+
+def _stage_aggregates(inputs, outputs):
+    df = pd.read_pickle(inputs[0])
+    decade_path, metro_path, address_path, sqm_path = outputs
+
+    analyze_special_cases.analyze_by_build_decade(df).to_csv(decade_path)
+    metro_styled, address_styled = analyze_special_cases.analyze_price_by_location(df, dedup=True)
+    metro_styled.data.to_csv(metro_path)
+    address_styled.data.to_csv(address_path)
+    stats, _ = analyze_special_cases.analyze_price_per_sqm(df)
+    stats.to_csv(sqm_path)
+    plt.close("all")
+
+
+def _save_open_figures(paths):
+    """Сохраняет открытые фигуры (по порядку создания) в переданные пути."""
+    for num, path in zip(plt.get_fignums(), paths):
+        plt.figure(num).savefig(path, dpi=100, bbox_inches="tight")
+    plt.close("all")
+
+
+def _stage_figures(inputs, outputs):
+    df = pd.read_pickle(inputs[0])
+    outputs = list(outputs)
+    n = len(DISTRIBUTION_COLUMNS)
+
+    for col, path in zip(DISTRIBUTION_COLUMNS, outputs[:n]):
+        analyze_distributions.plot_distribution(df, col, analyze_price_factors.feature_names[col])
+        _save_open_figures([path])
+
+    analyze_price_factors.analyze_numeric_corr(df, CORR_COLUMNS)
+    _save_open_figures(outputs[n:n + 1])
+    analyze_special_cases.analyze_by_build_decade(df)
+    _save_open_figures(outputs[n + 1:n + 2])
+    analyze_special_cases.analyze_price_by_location(df, dedup=True)
+    _save_open_figures(outputs[n + 2:n + 4])
+    analyze_special_cases.analyze_price_per_sqm(df)
+    _save_open_figures(outputs[n + 4:n + 5])
+
+
+STAGES = [
+    Stage("raw", None, outputs=(DATA_DIR / "rent_offers.csv",)),
+    Stage(
+        "processed", _stage_processed, deps=("raw",),
+        outputs=(DATA_DIR / "processed_offers.csv", DATA_DIR / "locations.csv", validate.VALIDATION_LOG),
+        modules=(clean_data, locations, validate),
+    ),
+    Stage(
+        "history", _stage_history, deps=("processed",),
+        outputs=(history.HISTORY_DIR / "manifest.json",),
+        modules=(history,),
+    ),
+    Stage(
+        "dedup", _stage_dedup, deps=("processed",),
+        outputs=(dedup.CLUSTERS_PATH,),
+        modules=(dedup, analyze_special_cases, locations),
+    ),
+    Stage(
+        "features", _stage_features, deps=("processed", "dedup"),
+        outputs=(CACHE_DIR / "features.pkl",),
+        modules=(analyze_special_cases, analyze_distributions, locations),
+    ),
+    Stage(
+        "eda", _stage_eda, deps=("processed",),
+        outputs=(CACHE_DIR / "eda_summary.csv",),
+        modules=(eda,),
+    ),
+    Stage(
+        "price_model", _stage_price_model, deps=("features",),
+        outputs=(price_model.MODEL_PATH,),
+        modules=(price_model,),
+    ),
+    Stage(
+        "spatial", _stage_spatial, deps=("features",),
+        outputs=(AGGREGATES_DIR / "price_grid.csv",),
+        modules=(spatial, locations),
+    ),
+    Stage(
+        "aggregates", _stage_aggregates, deps=("features",),
+        outputs=(
+            AGGREGATES_DIR / "build_decade.csv",
+            AGGREGATES_DIR / "metro.csv",
+            AGGREGATES_DIR / "address.csv",
+            AGGREGATES_DIR / "price_per_sqm.csv",
+        ),
+        modules=(analyze_special_cases, density_plots),
+    ),
+    Stage(
+        "figures", _stage_figures, deps=("features",),
+        outputs=tuple(FIGURES_DIR / f"dist_{col}.png" for col in DISTRIBUTION_COLUMNS) + (
+            FIGURES_DIR / "corr.png",
+            FIGURES_DIR / "build_decade.png",
+            FIGURES_DIR / "metro.png",
+            FIGURES_DIR / "address.png",
+            FIGURES_DIR / "price_per_sqm.png",
+        ),
+        modules=(analyze_distributions, analyze_price_factors, analyze_special_cases, density_plots),
+    ),
+]
+
+
+def stages_by_name(stages=None) -> dict:
+    return {s.name: s for s in (stages or STAGES)}
+
+
+def _select(targets, stages: dict) -> set:
+    """Имена запрошенных стадий вместе со всеми их предками."""
+    selected = set()
+    stack = list(targets)
+    while stack:
+        name = stack.pop()
+        if name not in stages:
+            raise ValueError(f"Неизвестная стадия: {name}")
+        if name not in selected:
+            selected.add(name)
+            stack.extend(stages[name].deps)
+    return selected
+
+
+def _waves(selected, stages: dict) -> list:
+    """Топологическая сортировка по уровням: стадии одного уровня независимы."""
+    done, waves = set(), []
+    remaining = set(selected)
+    while remaining:
+        wave = sorted(n for n in remaining if all(d in done for d in stages[n].deps))
+        if not wave:
+            raise ValueError(f"Цикл в зависимостях стадий: {sorted(remaining)}")
+        waves.append(wave)
+        done.update(wave)
+        remaining.difference_update(wave)
+    return waves
+
+
+def stage_key(stage: Stage, stages: dict, params: dict = None) -> str:
+    """Ключ мемоизации: хэши входных файлов + версия кода стадии + параметры."""
+    input_hashes = [file_hash(p) for d in stage.deps for p in stages[d].outputs]
+    source = inspect.getsource(stage.func) if stage.func else ""
+    return combine_hashes(input_hashes, code_version(*stage.modules), source, params or {})
+
+
+def _load_manifest() -> dict:
+    if MANIFEST_PATH.exists():
+        return json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
+    return {}
+
+
+def _save_manifest(manifest: dict):
+    MANIFEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+    MANIFEST_PATH.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+def _run_stage(func, inputs: list, outputs: list, params: dict) -> float:
+    start = time.perf_counter()
+    for path in outputs:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+    func(inputs, outputs, **params)
+    return time.perf_counter() - start
+
+
+def run_pipeline(targets=None, force=(), workers: int = None, stage_params: dict = None, stages=None) -> dict:
+    """
+    Выполняет стадии конвейера, пропуская актуальные.
+
+    Args:
+        targets: имена нужных стадий (по умолчанию все)
+        force: имена стадий, которые нужно пересчитать принудительно
+        workers: число процессов для параллельных стадий
+        stage_params: дополнительные аргументы стадий {имя: {параметр: значение}}
+        stages: список Stage (по умолчанию STAGES)
+
+    Returns:
+        dict: {имя стадии: "cached" | "ran" | "source"}
+    """
+    stages = stages_by_name(stages)
+    stage_params = stage_params or {}
+    selected = _select(targets or list(stages), stages)
+    manifest = _load_manifest()
+    status = {}
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for wave in _waves(selected, stages):
+            pending = {}
+            for name in wave:
+                stage = stages[name]
+                params = stage_params.get(name, {})
+                if stage.func is None:
+                    # Источник данных: не пересчитывается (см. --crawl)
+                    status[name] = "source"
+                    continue
+                key = stage_key(stage, stages, params)
+                entry = manifest.get(name, {})
+                outputs_ok = all(Path(p).exists() for p in stage.outputs)
+                outputs_same = entry.get("outputs") == {str(p): file_hash(p) for p in stage.outputs}
+                if name not in force and entry.get("key") == key and outputs_ok and outputs_same:
+                    status[name] = "cached"
+                    continue
+                inputs = [p for d in stage.deps for p in stages[d].outputs]
+                pending[name] = (key, pool.submit(_run_stage, stage.func, inputs, list(stage.outputs), params))
+
+            for name, (key, future) in pending.items():
+                elapsed = future.result()
+                stage = stages[name]
+                manifest[name] = {
+                    "key": key,
+                    "outputs": {str(p): file_hash(p) for p in stage.outputs},
+                }
+                status[name] = "ran"
+                print(f"[{name}] пересчитано за {elapsed:.2f} с")
+            _save_manifest(manifest)
+
+    for name in sorted(status):
+        if status[name] == "cached":
+            print(f"[{name}] без изменений, взято из кэша")
+    return status
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Конвейер parse → clean → analyze с кэшированием стадий")
+    parser.add_argument("targets", nargs="*", help="стадии для выполнения (по умолчанию все)")
+    parser.add_argument("--force", nargs="*", default=[], help="стадии для принудительного пересчёта")
+    parser.add_argument("--workers", type=int, default=None, help="число параллельных процессов")
+    parser.add_argument("--crawl", type=int, metavar="PAGES", help="заново собрать данные с N страниц")
+    parser.add_argument("--list", action="store_true", help="показать стадии и выйти")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for stage in STAGES:
+            deps = ", ".join(stage.deps) or "—"
+            print(f"{stage.name:<12} зависит от: {deps}")
+        return 0
+
+    stages = list(STAGES)
+    stage_params = {}
+    force = set(args.force)
+    if args.crawl:
+        stages = [Stage("raw", _stage_raw, outputs=s.outputs) if s.name == "raw" else s for s in stages]
+        stage_params["raw"] = {"num_pages": args.crawl}
+        force.add("raw")
+
+    run_pipeline(args.targets, force=force, workers=args.workers,
+                 stage_params=stage_params, stages=stages)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
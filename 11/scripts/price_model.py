@@ -0,0 +1,363 @@
+"""
+Гедоническая модель цены: совместное влияние локации, эпохи, площади и удобств.
+
+Матрица признаков разреженная: стандартизованные числовые признаки,
+one-hot для метро, эпохи постройки, отделки и санузла, multi-hot для элементов
+списков (удобства, теги, информация о доме). Модель — гребневая регрессия
+логарифма цены. Обучение хранит достаточные статистики XᵀX и Xᵀy, поэтому
+дообучение на новых объявлениях добавляет только их вклад, а не переобучает
+модель с нуля. Вместе со статистиками хранятся учтённые строки матрицы
+признаков и их категории/элементы списков: у снятых и изменившихся объявлений
+вклад вычитается, частоты элементов считаются по учтённым строкам, а когда
+элемент попадает в словарь, его столбец заполняется и у ранее учтённых строк.
+Поэтому статистики совпадают с посчитанными заново по тем же строкам с тем же
+словарём и масштабированием.
+
+Модель помечается версией кода; сохранённая модель другой версии не
+загружается (масштабирование и словарь признаков могли устареть).
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.sparse.linalg import cg
+
+from analyze_special_cases import build_period
+from artifacts import CACHE_DIR, code_version, load_pickle, save_pickle
+
+MODEL_PATH = CACHE_DIR / "price_model.pkl"
+
+NUMERIC_FEATURES = [
+    "square_meters", "living_meters", "kitchen_meters", "ceiling_height",
+    "floor", "build_year", "building_floors", "apartments_count", "entrances_count",
+    "living_ratio", "kitchen_ratio", "floors_diff", "density",
+]
+CATEGORICAL_FEATURES = ["metro", "build_decade", "renovation_type", "bathroom_type"]
+LIST_FEATURES = ["amenities", "tags", "building_info"]
+
+CODE_VERSION = code_version(sys.modules[__name__])
+
+
+def _with_decade(df: pd.DataFrame) -> pd.DataFrame:
+    if "build_decade" not in df.columns and "build_year" in df.columns:
+        df = df.assign(build_decade=df["build_year"].map(build_period))
+    return df
+
+
+def _item_matrix(df: pd.DataFrame, model: dict) -> sp.csr_matrix:
+    """
+    Матрица «строка × элемент» категорий и элементов списков (повтор в строке считается один раз).
+
+    Элементы нумеруются в model["tokens"]; незнакомые регистрируются.
+    """
+    rows, keys = [], []
+    for col in CATEGORICAL_FEATURES + LIST_FEATURES:
+        if col not in df.columns:
+            continue
+        series = df[col].reset_index(drop=True)
+        if col in LIST_FEATURES:
+            series = series.explode()
+        series = series.astype(object).dropna()
+        rows.append(series.index.to_numpy())
+        keys.extend((col, item) for item in series.to_numpy())
+    tokens = model["tokens"]
+    ids = np.fromiter((tokens.setdefault(key, len(tokens)) for key in keys), dtype=np.int64, count=len(keys))
+    rows = np.concatenate(rows) if rows else np.array([], dtype=np.int64)
+    items = sp.csr_matrix((np.ones(len(ids)), (rows, ids)), shape=(len(df), len(tokens)))
+    items.data[:] = 1.0  # повторы элемента в строке при построении сложились
+    return items
+
+
+def _grow(model: dict):
+    """Дополняет статистики и сохранённые строки нулями до текущего числа признаков."""
+    p = model["n_features"]
+    old = model["xtx"].shape[0]
+    if old < p:
+        model["xtx"] = sp.block_diag([model["xtx"], sp.csr_matrix((p - old, p - old))], format="csr")
+        model["xty"] = np.concatenate([model["xty"], np.zeros(p - old)])
+    model["rows"] = _widen(model["rows"], p)
+
+
+def _extend_vocab(model: dict):
+    """
+    Добавляет в словарь элементы, набравшие min_count среди учтённых строк.
+
+    Новые столбцы идут в конец; у учтённых строк с этим элементом столбец
+    заполняется, а XᵀX и Xᵀy поправляются на разницу.
+    """
+    counts = np.asarray(model["items"].sum(axis=0)).ravel()
+    keys = list(model["tokens"])
+    new = [
+        t for t in np.flatnonzero(counts >= model["min_count"])
+        if keys[t][1] not in model["vocab"].get(keys[t][0], {})
+    ]
+    if not new:
+        return
+    first = model["n_features"]
+    for t in new:
+        col, item = keys[t]
+        model["vocab"].setdefault(col, {})[item] = model["n_features"]
+        model["columns"].append(f"{col}={item}")
+        model["n_features"] += 1
+    _grow(model)
+
+    hits = model["items"][:, new].tocoo()
+    added = sp.csr_matrix((np.ones(len(hits.row)), (hits.row, first + hits.col)),
+                          shape=(model["n_rows"], model["n_features"]))
+    affected = np.unique(hits.row)
+    before = model["rows"][affected]
+    after = before + added[affected]
+    model["xtx"] = (model["xtx"] + after.T @ after - before.T @ before).tocsr()
+    model["xty"] = model["xty"] + added[affected].T @ model["y"][affected]
+    model["rows"] = (model["rows"] + added).tocsr()
+
+
+def design_matrix(df: pd.DataFrame, model: dict) -> sp.csr_matrix:
+    """
+    Разреженная матрица признаков для df по словарю модели.
+
+    Неизвестные категории и элементы списков игнорируются, пропуски числовых
+    признаков заменяются средним (нулём после стандартизации).
+    """
+    df = _with_decade(df)
+    n = len(df)
+    blocks_rows, blocks_cols, blocks_vals = [np.arange(n)], [np.zeros(n, dtype=np.int64)], [np.ones(n)]
+
+    for j, col in enumerate(NUMERIC_FEATURES, start=1):
+        mean, std = model["scaling"][col]
+        values = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float) if col in df.columns else np.full(n, mean)
+        values = (values - mean) / std
+        values[~np.isfinite(values)] = 0.0
+        blocks_rows.append(np.arange(n))
+        blocks_cols.append(np.full(n, j, dtype=np.int64))
+        blocks_vals.append(values)
+
+    for col in CATEGORICAL_FEATURES + LIST_FEATURES:
+        vocab = model["vocab"].get(col)
+        if not vocab or col not in df.columns:
+            continue
+        series = df[col].reset_index(drop=True)
+        if col in LIST_FEATURES:
+            series = series.explode()
+        cols = series.astype(object).map(vocab).dropna()
+        # Повтор элемента в одном списке не должен удваивать признак
+        pairs = pd.DataFrame({"row": cols.index, "col": cols.to_numpy(dtype=np.int64)}).drop_duplicates()
+        blocks_rows.append(pairs["row"].to_numpy())
+        blocks_cols.append(pairs["col"].to_numpy())
+        blocks_vals.append(np.ones(len(pairs)))
+
+    return sp.csr_matrix(
+        (np.concatenate(blocks_vals), (np.concatenate(blocks_rows), np.concatenate(blocks_cols))),
+        shape=(n, model["n_features"]),
+    )
+
+
+def _target(df: pd.DataFrame) -> np.ndarray:
+    return np.log(pd.to_numeric(df["price"], errors="coerce").to_numpy(dtype=float))
+
+
+def _trainable(df: pd.DataFrame) -> pd.DataFrame:
+    price = pd.to_numeric(df["price"], errors="coerce")
+    return df[price.notna() & (price > 0)]
+
+
+def _widen(X: sp.csr_matrix, p: int) -> sp.csr_matrix:
+    """Та же матрица с p столбцами (новые столбцы нулевые)."""
+    return sp.csr_matrix((X.data, X.indices, X.indptr), shape=(X.shape[0], p))
+
+
+def _accumulate(model: dict, df: pd.DataFrame):
+    """Добавляет вклад строк df в XᵀX и Xᵀy и запоминает строки (словарь расширяет _extend_vocab)."""
+    items = _item_matrix(df, model)
+    X = design_matrix(df, model)
+    y = _target(df)
+    _grow(model)
+    model["xtx"] = (model["xtx"] + X.T @ X).tocsr()
+    model["xty"] = model["xty"] + X.T @ y
+
+    n_tokens = len(model["tokens"])
+    model["rows"] = sp.vstack([model["rows"], X], format="csr")
+    model["items"] = sp.vstack([_widen(model["items"], n_tokens), _widen(items, n_tokens)], format="csr")
+    model["y"] = np.concatenate([model["y"], y])
+    model["links"] = np.concatenate([model["links"], df["link"].astype(str).to_numpy(dtype=object)])
+    model["n_rows"] = len(model["links"])
+
+
+def _subtract(model: dict, positions: np.ndarray):
+    """Вычитает вклад запомненных строк из XᵀX и Xᵀy и забывает их (вместе с их элементами)."""
+    X = model["rows"][positions]
+    model["xtx"] = (model["xtx"] - X.T @ X).tocsr()
+    model["xty"] = model["xty"] - X.T @ model["y"][positions]
+    keep = np.ones(model["n_rows"], dtype=bool)
+    keep[positions] = False
+    for key in ["rows", "items", "y", "links"]:
+        model[key] = model[key][keep]
+    model["n_rows"] = len(model["links"])
+
+
+def _differs(a: sp.csr_matrix, b: sp.csr_matrix) -> np.ndarray:
+    """Маска строк, в которых разреженные матрицы различаются."""
+    diff = (a - b).tocoo()
+    mask = np.zeros(a.shape[0], dtype=bool)
+    mask[diff.row[np.abs(diff.data) > 1e-9]] = True
+    return mask
+
+
+def _changed(model: dict, df: pd.DataFrame, positions: np.ndarray) -> np.ndarray:
+    """Маска строк df, у которых признаки, элементы или цена отличаются от запомненных."""
+    items = _item_matrix(df, model)
+    n_tokens = len(model["tokens"])
+    changed = _differs(design_matrix(df, model), model["rows"][positions])
+    changed |= _differs(_widen(items, n_tokens), _widen(model["items"][positions], n_tokens))
+    # Пропуск в новой цене тоже изменение: строку нужно убрать из модели
+    return changed | ~(np.abs(_target(df) - model["y"][positions]) <= 1e-12)
+
+
+def _solve(model: dict):
+    """Решает (XᵀX + αI)w = Xᵀy сопряжёнными градиентами; свободный член не штрафуется."""
+    p = model["n_features"]
+    penalty = np.full(p, model["alpha"])
+    penalty[0] = 0.0
+    A = model["xtx"] + sp.diags(penalty)
+    x0 = np.concatenate([model["coef"], np.zeros(p - len(model["coef"]))]) if len(model.get("coef", [])) else None
+    coef, info = cg(A, model["xty"], x0=x0, rtol=1e-8, maxiter=10 * p)
+    if info > 0:
+        print(f"Предупреждение: решатель не сошёлся за {info} итераций")
+    model["coef"] = coef
+
+
+def fit_price_model(df: pd.DataFrame, alpha: float = 1.0, min_count: int = 3) -> dict:
+    """
+    Обучает модель с нуля.
+
+    Args:
+        df: подготовленные объявления (prepare_dataframe + calculate_additional_columns)
+        alpha: сила L2-регуляризации
+        min_count: минимальная частота категории/элемента списка для отдельного признака
+
+    Returns:
+        dict: состояние модели (словарь признаков, статистики, коэффициенты)
+    """
+    df = _trainable(_with_decade(df)).drop_duplicates("link", keep="last")
+    scaling = {}
+    for col in NUMERIC_FEATURES:
+        values = pd.to_numeric(df[col], errors="coerce") if col in df.columns else pd.Series(dtype=float)
+        mean, std = values.mean(), values.std()
+        scaling[col] = (0.0 if pd.isna(mean) else mean, 1.0 if not std or pd.isna(std) else std)
+
+    model = {
+        "alpha": alpha,
+        "min_count": min_count,
+        "scaling": scaling,
+        "columns": ["intercept"] + NUMERIC_FEATURES,
+        "n_features": 1 + len(NUMERIC_FEATURES),
+        "vocab": {},
+        "tokens": {},
+        "xtx": sp.csr_matrix((1 + len(NUMERIC_FEATURES),) * 2),
+        "xty": np.zeros(1 + len(NUMERIC_FEATURES)),
+        "coef": np.array([]),
+        "n_rows": 0,
+        "rows": sp.csr_matrix((0, 1 + len(NUMERIC_FEATURES))),
+        "items": sp.csr_matrix((0, 0)),
+        "y": np.array([]),
+        "links": np.array([], dtype=object),
+        "code_version": CODE_VERSION,
+    }
+    _accumulate(model, df)
+    _extend_vocab(model)
+    _solve(model)
+    return model
+
+
+def update_price_model(model: dict, df: pd.DataFrame, removed=(), complete: bool = False) -> dict:
+    """
+    Обновляет модель по новым, изменившимся и снятым объявлениям.
+
+    Объявления df, которых модель не видела (по ссылке), добавляются; у
+    изменившихся (другая цена или признаки) старый вклад вычитается и
+    добавляется новый. Категории, набравшие min_count среди учтённых строк,
+    добавляются как новые столбцы и заполняются у всех строк с ними, поэтому
+    статистики остаются точными. Столбцы, у которых частота потом упала, не
+    удаляются.
+
+    Args:
+        model: модель из fit_price_model / load_model
+        df: новые и изменившиеся объявления (или все актуальные при complete=True)
+        removed: ссылки снятых объявлений — их вклад вычитается
+        complete: df содержит все актуальные объявления; отсутствующие в нём
+            (снятые, попавшие в карантин) удаляются из модели
+    """
+    df = _with_decade(df).drop_duplicates("link", keep="last")
+    links = df["link"].astype(str).to_numpy(dtype=object)
+    stored = pd.Index(model["links"])
+    positions = stored.get_indexer(links)
+    known = positions >= 0
+
+    changed = np.zeros(len(df), dtype=bool)
+    if known.any():
+        changed[known] = _changed(model, df[known], positions[known])
+    drop = set(positions[changed].tolist())
+    drop.update(p for p in stored.get_indexer(pd.Index(removed, dtype=object).astype(str)).tolist() if p >= 0)
+    if complete:
+        drop.update(np.flatnonzero(~stored.isin(links)).tolist())
+
+    fresh = _trainable(df[~known | changed])
+    if not drop and fresh.empty:
+        return model
+    if drop:
+        _subtract(model, np.array(sorted(drop)))
+    if not fresh.empty:
+        _accumulate(model, fresh)
+        _extend_vocab(model)
+    _solve(model)
+    print(f"Модель обновлена: учтено {len(fresh)} новых и изменённых, убрано {len(drop)} строк "
+          f"(всего {model['n_rows']})")
+    return model
+
+
+def predict(df: pd.DataFrame, model: dict, batch_size: int = 200_000) -> pd.Series:
+    """Предсказанная цена (₽ в сутки) для каждой строки df, пакетами по batch_size."""
+    parts = []
+    for start in range(0, len(df), batch_size):
+        X = design_matrix(df.iloc[start:start + batch_size], model)
+        parts.append(np.exp(X @ model["coef"]))
+    values = np.concatenate(parts) if parts else np.array([])
+    return pd.Series(values, index=df.index, name="predicted_price")
+
+
+def coefficients(model: dict) -> pd.Series:
+    """Коэффициенты модели (в логарифмической шкале) с именами признаков."""
+    return pd.Series(model["coef"], index=model["columns"], name="coef")
+
+
+def flag_mispriced(df: pd.DataFrame, model: dict, threshold: float = 0.3) -> pd.DataFrame:
+    """
+    Сравнивает фактическую цену с модельной.
+
+    Объявление помечается как «завышена» / «занижена», если цена отличается
+    от модельной больше чем на threshold (доля).
+    """
+    result = df[["link", "price", "square_meters", "address", "metro"]].copy()
+    result["predicted_price"] = predict(df, model).round(0)
+    result["price_ratio"] = (result["price"] / result["predicted_price"]).round(2)
+    result["flag"] = np.select(
+        [result["price_ratio"] > 1 + threshold, result["price_ratio"] < 1 - threshold],
+        ["завышена", "занижена"],
+        default="",
+    )
+    return result
+
+
+def save_model(model: dict, path=None):
+    save_pickle(model, path or MODEL_PATH)
+
+
+def load_model(path=None):
+    """Загружает сохранённую модель или возвращает None, если её нет или она обучена другой версией кода."""
+    path = Path(path or MODEL_PATH)
+    if not path.exists():
+        return None
+    model = load_pickle(path)
+    return model if model.get("code_version") == CODE_VERSION else None
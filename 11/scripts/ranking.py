@@ -0,0 +1,134 @@
+"""
+Ранжирующие индексы для запросов «топ-k» и «значение в диапазоне».
+
+Для цены, цены за м² и площади один раз на версию датасета сохраняются
+отсортированные перестановки — для всего датасета и для каждой станции метро
+и эпохи постройки. После этого топ-k отвечает за O(k), а диапазон
+«цена от X до Y» — за O(log n + k). Для произвольных фильтров есть
+запасной путь через np.argpartition без полной сортировки.
+"""
+import numpy as np
+import pandas as pd
+
+from artifacts import frame_hash
+
+RANK_COLUMNS = ["price", "price_per_sqm", "square_meters"]
+GROUP_COLUMNS = ["metro", "build_decade"]
+
+_INDEX_CACHE = {}
+
+
+def _sorted_permutation(values: np.ndarray, positions: np.ndarray) -> dict:
+    """Позиции строк, упорядоченные по возрастанию значения (без пропусков)."""
+    valid = ~np.isnan(values)
+    positions, values = positions[valid], values[valid]
+    order = np.argsort(values, kind="stable")
+    return {"order": positions[order], "values": values[order]}
+
+
+def build_ranking_index(df: pd.DataFrame, columns: list = None, groups: list = None) -> dict:
+    """
+    Строит отсортированные перестановки по колонкам, целиком и по группам.
+
+    Returns:
+        dict: {"all": {колонка: перестановка}, "groups": {(группа, значение): {колонка: перестановка}}}
+    """
+    columns = columns or RANK_COLUMNS
+    groups = groups or GROUP_COLUMNS
+    if "build_decade" in groups and "build_decade" not in df.columns:
+        from analyze_special_cases import build_period
+        df = df.assign(build_decade=df["build_year"].map(build_period))
+
+    positions = np.arange(len(df))
+    index = {"all": {}, "groups": {}}
+    for col in columns:
+        values = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=float)
+        index["all"][col] = _sorted_permutation(values, positions)
+
+        # Перестановки по группам: одна сортировка по (группа, значение), затем разрезание
+        for group in groups:
+            codes, uniques = pd.factorize(df[group], sort=False)
+            valid = (codes >= 0) & ~np.isnan(values)
+            order = np.lexsort((values[valid], codes[valid]))
+            sorted_pos = positions[valid][order]
+            sorted_codes = codes[valid][order]
+            sorted_values = values[valid][order]
+            bounds = np.flatnonzero(np.diff(sorted_codes)) + 1
+            for pos, vals in zip(np.split(sorted_pos, bounds), np.split(sorted_values, bounds)):
+                if len(pos):
+                    key = (group, uniques[codes[pos[0]]])
+                    index["groups"].setdefault(key, {})[col] = {"order": pos, "values": vals}
+    return index
+
+
+def get_ranking_index(df: pd.DataFrame, version: str = None) -> dict:
+    """
+    Индекс для текущей версии датасета (строится один раз на версию).
+
+    version — ключ версии, посчитанный один раз при загрузке (например,
+    второй элемент live_data state["frame"]); без него версия определяется хэшем
+    колонок, что требует прохода по всем строкам.
+    """
+    if version is None:
+        version = frame_hash(df, [c for c in RANK_COLUMNS + ["metro", "build_year"] if c in df.columns])
+    if version not in _INDEX_CACHE:
+        _INDEX_CACHE.clear()
+        _INDEX_CACHE[version] = build_ranking_index(df)
+    return _INDEX_CACHE[version]
+
+
+def _permutation(index: dict, column: str, group: tuple = None) -> dict:
+    if group is None:
+        return index["all"][column]
+    return index["groups"].get(tuple(group), {}).get(column, {"order": np.array([], dtype=int), "values": np.array([])})
+
+
+def top_k(index: dict, column: str, k: int, group: tuple = None, largest: bool = True, where: np.ndarray = None) -> np.ndarray:
+    """
+    Позиции k строк с наибольшими (или наименьшими) значениями column.
+
+    Args:
+        group: (колонка группы, значение), например ("metro", "Арбатская")
+        where: булева маска по строкам датасета — строки, не прошедшие её,
+            пропускаются при обходе перестановки
+    """
+    order = _permutation(index, column, group)["order"]
+    if largest:
+        order = order[::-1]
+    if where is None:
+        return order[:k]
+
+    # Обходим перестановку порциями, пока не наберём k подходящих строк
+    found, start, step = [], 0, max(k * 4, 64)
+    while start < len(order) and sum(map(len, found)) < k:
+        chunk = order[start:start + step]
+        found.append(chunk[where[chunk]])
+        start += step
+        step *= 2
+    return np.concatenate(found)[:k] if found else order[:0]
+
+
+def value_range(index: dict, column: str, low=None, high=None, group: tuple = None) -> np.ndarray:
+    """Позиции строк с low <= column <= high (по возрастанию значения)."""
+    perm = _permutation(index, column, group)
+    lo = 0 if low is None else np.searchsorted(perm["values"], low, side="left")
+    hi = len(perm["values"]) if high is None else np.searchsorted(perm["values"], high, side="right")
+    return perm["order"][lo:hi]
+
+
+def top_k_masked(df: pd.DataFrame, column: str, k: int, mask=None, largest: bool = True) -> np.ndarray:
+    """
+    Топ-k для произвольного фильтра без индекса: np.argpartition за O(n),
+    затем сортировка только k отобранных строк.
+    """
+    values = pd.to_numeric(df[column], errors="coerce").to_numpy(dtype=float)
+    positions = np.arange(len(df))
+    valid = ~np.isnan(values) if mask is None else ~np.isnan(values) & np.asarray(mask, dtype=bool)
+    positions, values = positions[valid], values[valid]
+    if largest:
+        values = -values
+    k = min(k, len(values))
+    if k == 0:
+        return positions[:0]
+    part = np.argpartition(values, k - 1)[:k]
+    return positions[part[np.argsort(values[part], kind="stable")]]
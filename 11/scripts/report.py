@@ -0,0 +1,260 @@
+"""
+Статический отчёт по всем анализам без запуска ноутбука.
+
+Каждый раздел отчёта выполняется в отдельном процессе с неинтерактивным
+бэкендом matplotlib: текстовый вывод функций перехватывается, таблицы и
+графики встраиваются прямо в один HTML/Markdown-файл. Результат раздела
+кэшируется по хэшу входных данных и версии кода, поэтому при неизменных
+данных отчёт собирается из кэша.
+
+Запуск:
+    python scripts/report.py                       # data/report.html
+    python scripts/report.py --format md -o report.md
+"""
+import matplotlib
+
+matplotlib.use("Agg")
+
+import argparse
+import base64
+import contextlib
+import html
+import io
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import matplotlib.pyplot as plt
+import pandas as pd
+
+import analyze_distributions
+import analyze_price_factors
+import analyze_special_cases
+import density_plots
+import eda
+from artifacts import CACHE_DIR, DATA_DIR, code_version, combine_hashes, file_hash, load_pickle, save_pickle
+from pipeline import run_pipeline, stages_by_name
+
+REPORT_CACHE_DIR = CACHE_DIR / "report"
+REPORT_MODULES = (analyze_distributions, analyze_price_factors, analyze_special_cases, density_plots, eda)
+
+
+def _collect_figures() -> list:
+    """Сохраняет все открытые фигуры в PNG-байты и закрывает их."""
+    images = []
+    for num in plt.get_fignums():
+        buf = io.BytesIO()
+        plt.figure(num).savefig(buf, format="png", dpi=100, bbox_inches="tight")
+        images.append(buf.getvalue())
+    plt.close("all")
+    return images
+
+
+# --- Разделы отчёта: каждая функция возвращает список таблиц (подпись, DataFrame) ---
+
+def _section_eda(paths):
+    return [("Обзорная сводка признаков", eda.run_eda(str(paths["processed"])))]
+
+
+def _section_distribution(paths, column):
+    df = pd.read_pickle(paths["features"])
+    stats = analyze_distributions.analyze_numeric_column(df, column)
+    analyze_distributions.plot_distribution(df, column, analyze_price_factors.feature_names[column])
+    table = pd.DataFrame({"Значение": stats}).round(2)
+    return [(f"Статистика: {analyze_price_factors.feature_names[column]}", table)]
+
+
+def _section_corr(paths):
+    df = pd.read_pickle(paths["features"])
+    columns = [c for c in analyze_price_factors.feature_names if c != "price"]
+    analyze_price_factors.analyze_numeric_corr(df, columns)
+    return []
+
+
+def _section_categorical(paths):
+    df = pd.read_pickle(paths["features"])
+    for column in ["bathroom_type", "renovation_type", "metro", "address"]:
+        analyze_price_factors.analyze_categorical_impact(df, column)
+    return []
+
+
+def _section_list_columns(paths):
+    df = pd.read_pickle(paths["features"])
+    for column in ["amenities", "tags", "building_info"]:
+        analyze_price_factors.analyze_list_column_impact(df, column)
+    return []
+
+
+def _section_build_decade(paths):
+    df = pd.read_pickle(paths["features"])
+    summary = analyze_special_cases.analyze_by_build_decade(df)
+    return [("Средняя цена по эпохам постройки", summary)]
+
+
+def _section_location(paths):
+    df = pd.read_pickle(paths["features"])
+    metro_styled, address_styled = analyze_special_cases.analyze_price_by_location(df, dedup=True)
+    return [
+        ("ТОП 20 станций метро по средней цене", metro_styled.data),
+        ("ТОП 20 адресов по средней цене", address_styled.data),
+    ]
+
+
+def _section_price_per_sqm(paths):
+    df = pd.read_pickle(paths["features"])
+    stats, top5 = analyze_special_cases.analyze_price_per_sqm(df)
+    return [
+        ("Статистика цены за м²", stats.to_frame("price_per_sqm")),
+        ("ТОП 5 квартир по цене за м²", top5.round(2)),
+    ]
+
+
+def _section_anomaly(paths):
+    df = pd.read_pickle(paths["features"])
+    row = analyze_special_cases.find_smallest_most_expensive(df)
+    return [("Самая дорогая (за м²) и маленькая квартира", row.to_frame("Значение"))]
+
+
+SECTIONS = [
+    ("Обзор данных", _section_eda, {}),
+    *[
+        (f"Распределение: {title}", _section_distribution, {"column": col})
+        for col, title in analyze_price_factors.feature_names.items()
+    ],
+    ("Корреляции с ценой", _section_corr, {}),
+    ("Категориальные признаки", _section_categorical, {}),
+    ("Списковые признаки", _section_list_columns, {}),
+    ("Цена по эпохам постройки", _section_build_decade, {}),
+    ("Цена по метро и адресу", _section_location, {}),
+    ("Цена за квадратный метр", _section_price_per_sqm, {}),
+    ("Аномалия: маленькая и дорогая квартира", _section_anomaly, {}),
+]
+
+
+def _run_section(func, paths: dict, kwargs: dict) -> dict:
+    """Выполняет раздел, перехватывая stdout и открытые фигуры."""
+    start = time.perf_counter()
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        tables = func(paths, **kwargs)
+    return {
+        "text": out.getvalue().strip(),
+        "tables": tables,
+        "figures": _collect_figures(),
+        "elapsed": time.perf_counter() - start,
+    }
+
+
+def build_sections(workers: int = None, force: bool = False) -> list:
+    """
+    Готовит данные (через конвейер) и выполняет все разделы отчёта параллельно.
+
+    Returns:
+        list: [(заголовок, результат раздела, взят_из_кэша)]
+    """
+    run_pipeline(["features", "eda"], workers=workers)
+    stages = stages_by_name()
+    paths = {
+        "processed": stages["processed"].outputs[0],
+        "features": stages["features"].outputs[0],
+    }
+    data_key = combine_hashes(file_hash(paths["processed"]), file_hash(paths["features"]))
+    version = code_version(*REPORT_MODULES, sys.modules[__name__])
+
+    results, pending = {}, {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for title, func, kwargs in SECTIONS:
+            key = combine_hashes(data_key, version, func.__name__, kwargs)
+            cache_path = REPORT_CACHE_DIR / f"{func.__name__}-{key[:16]}.pkl"
+            if cache_path.exists() and not force:
+                results[title] = (load_pickle(cache_path), True)
+            else:
+                pending[title] = (cache_path, pool.submit(_run_section, func, paths, kwargs))
+
+        for title, (cache_path, future) in pending.items():
+            section = future.result()
+            save_pickle(section, cache_path)
+            results[title] = (section, False)
+
+    return [(title, *results[title]) for title, _, _ in SECTIONS]
+
+
+def _image_uri(png: bytes) -> str:
+    return "data:image/png;base64," + base64.b64encode(png).decode("ascii")
+
+
+def _markdown_table(df: pd.DataFrame) -> str:
+    df = df.reset_index()
+    header = "| " + " | ".join(map(str, df.columns)) + " |"
+    sep = "| " + " | ".join("---" for _ in df.columns) + " |"
+    rows = ["| " + " | ".join(str(v).replace("|", "\\|") for v in row) + " |" for row in df.itertuples(index=False)]
+    return "\n".join([header, sep, *rows])
+
+
+def render_html(sections: list) -> str:
+    parts = [
+        "<!DOCTYPE html>",
+        "<html lang='ru'><head><meta charset='utf-8'>",
+        "<title>Анализ посуточной аренды квартир в Москве</title>",
+        "<style>body{font-family:sans-serif;max-width:1100px;margin:auto}"
+        "table{border-collapse:collapse;font-size:13px}td,th{border:1px solid #ccc;padding:2px 6px}"
+        "pre{background:#f6f6f6;padding:8px;overflow-x:auto}img{max-width:100%}</style>",
+        "</head><body>",
+        "<h1>Анализ посуточной аренды квартир в Москве</h1>",
+    ]
+    for title, section, _ in sections:
+        parts.append(f"<h2>{html.escape(title)}</h2>")
+        if section["text"]:
+            parts.append(f"<pre>{html.escape(section['text'])}</pre>")
+        for caption, table in section["tables"]:
+            parts.append(f"<h3>{html.escape(caption)}</h3>")
+            parts.append(table.to_html(border=0))
+        for png in section["figures"]:
+            parts.append(f"<img src='{_image_uri(png)}'>")
+    parts.append("</body></html>")
+    return "\n".join(parts)
+
+
+def render_markdown(sections: list) -> str:
+    parts = ["# Анализ посуточной аренды квартир в Москве"]
+    for title, section, _ in sections:
+        parts.append(f"## {title}")
+        if section["text"]:
+            parts.append(f"```\n{section['text']}\n```")
+        for caption, table in section["tables"]:
+            parts.append(f"### {caption}\n\n{_markdown_table(table)}")
+        for png in section["figures"]:
+            parts.append(f"![]({_image_uri(png)})")
+    return "\n\n".join(parts) + "\n"
+
+
+def generate_report(output_path=None, fmt: str = "html", workers: int = None, force: bool = False) -> Path:
+    """Собирает отчёт и сохраняет его в один самодостаточный файл."""
+    start = time.perf_counter()
+    sections = build_sections(workers=workers, force=force)
+    text = render_html(sections) if fmt == "html" else render_markdown(sections)
+
+    output_path = Path(output_path or DATA_DIR / f"report.{fmt}")
+    output_path.write_text(text, encoding="utf-8")
+
+    cached = sum(1 for _, _, from_cache in sections if from_cache)
+    print(f"Разделов: {len(sections)}, из кэша: {cached}")
+    print(f"Отчёт сохранён в: {output_path} ({time.perf_counter() - start:.2f} с)")
+    return output_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Генерация статического отчёта по всем анализам")
+    parser.add_argument("-o", "--output", help="путь к файлу отчёта")
+    parser.add_argument("--format", choices=["html", "md"], default="html")
+    parser.add_argument("--workers", type=int, default=None, help="число параллельных процессов")
+    parser.add_argument("--force", action="store_true", help="игнорировать кэш разделов")
+    args = parser.parse_args(argv)
+
+    generate_report(args.output, fmt=args.format, workers=args.workers, force=args.force)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
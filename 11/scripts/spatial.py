@@ -0,0 +1,197 @@
+"""
+Пространственный слой: координаты станций метро, сетка и пространственный индекс.
+
+Координат квартир в данных нет, поэтому объявление привязывается к своей
+станции метро (офлайн-таблица data/metro_stations.csv, сопоставление через
+канонический ключ из locations). Станции индексируются KD-деревом в метрической
+проекции, объявления раскладываются по квадратной сетке. Агрегаты по ячейкам
+и группировка объявлений по станциям считаются один раз на версию датасета,
+поэтому карта и запросы по радиусу не просматривают все строки.
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from artifacts import CACHE_DIR, code_version, combine_hashes, file_hash, frame_hash, load_pickle, save_pickle
+from locations import normalize_location
+
+STATIONS_PATH = Path(__file__).parent.parent / "data" / "metro_stations.csv"
+SPATIAL_CACHE_DIR = CACHE_DIR / "spatial"
+
+# Центр проекции — Красная площадь
+CENTER_LAT, CENTER_LON = 55.7539, 37.6208
+KM_PER_DEG_LAT = 110.574
+KM_PER_DEG_LON = 111.320 * np.cos(np.radians(CENTER_LAT))
+
+_LAYER_CACHE = {}
+
+CODE_VERSION = code_version(sys.modules[__name__])
+
+
+def project(lat, lon):
+    """Широта/долгота → километры (x на восток, y на север) от центра Москвы."""
+    x = (np.asarray(lon, dtype=float) - CENTER_LON) * KM_PER_DEG_LON
+    y = (np.asarray(lat, dtype=float) - CENTER_LAT) * KM_PER_DEG_LAT
+    return x, y
+
+
+def unproject(x, y):
+    """Километры от центра → широта/долгота."""
+    lat = np.asarray(y, dtype=float) / KM_PER_DEG_LAT + CENTER_LAT
+    lon = np.asarray(x, dtype=float) / KM_PER_DEG_LON + CENTER_LON
+    return lat, lon
+
+
+def load_stations(path=None) -> pd.DataFrame:
+    """Таблица станций с каноническим ключом и метрическими координатами."""
+    stations = pd.read_csv(path or STATIONS_PATH)
+    stations["key"] = stations["name"].map(normalize_location)
+    stations["x_km"], stations["y_km"] = project(stations["lat"], stations["lon"])
+    return stations.drop_duplicates("key").reset_index(drop=True)
+
+
+def attach_coordinates(df: pd.DataFrame, stations: pd.DataFrame = None, cell_km: float = 1.0) -> pd.DataFrame:
+    """
+    Добавляет координаты станции, расстояние до центра и ячейку сетки.
+
+    Объявления со станцией не из таблицы получают пропуски.
+    """
+    stations = load_stations() if stations is None else stations
+    # Нормализуем только уникальные названия (метро — категориальная колонка)
+    keys = df["metro"].astype(object).map(normalize_location)
+    position = keys.map(dict(zip(stations["key"], stations.index)))
+
+    df["station_idx"] = position.astype("Int32")
+    pos = position.to_numpy(dtype=float)
+    valid = ~np.isnan(pos)
+    for col in ["lat", "lon", "x_km", "y_km"]:
+        values = np.full(len(df), np.nan)
+        values[valid] = stations[col].to_numpy()[pos[valid].astype(int)]
+        df[col] = values
+    df["center_km"] = np.hypot(df["x_km"], df["y_km"]).round(2)
+    df["cell_x"] = np.floor(df["x_km"] / cell_km).astype("Int32")
+    df["cell_y"] = np.floor(df["y_km"] / cell_km).astype("Int32")
+    return df
+
+
+def _grid_aggregates(df: pd.DataFrame, cell_km: float) -> pd.DataFrame:
+    """Число объявлений и медианы цен по ячейкам сетки."""
+    located = df[df["cell_x"].notna()]
+    grid = (
+        located.groupby(["cell_x", "cell_y"])
+        .agg(
+            count=("price", "count"),
+            median_price=("price", "median"),
+            median_price_per_sqm=("price_per_sqm", "median"),
+        )
+        .reset_index()
+    )
+    grid["lat"], grid["lon"] = unproject((grid["cell_x"] + 0.5) * cell_km, (grid["cell_y"] + 0.5) * cell_km)
+    return grid
+
+
+def build_spatial_layer(df: pd.DataFrame, cell_km: float = 1.0) -> dict:
+    """
+    Строит пространственный слой для датасета.
+
+    Returns:
+        dict: stations, tree (KD-дерево станций), offers_by_station
+        (позиции объявлений по станциям), grid (агрегаты по ячейкам), cell_km
+    """
+    stations = load_stations()
+    located = attach_coordinates(df.copy(), stations, cell_km)
+    valid = located["station_idx"].notna().to_numpy()
+    positions = np.flatnonzero(valid)
+    station_idx = located["station_idx"].to_numpy()[valid].astype(int)
+    offers_by_station = {
+        int(s): positions[idx] for s, idx in pd.Series(station_idx).groupby(station_idx).indices.items()
+    }
+
+    matched = located[located["station_idx"].notna()]
+    station_stats = (
+        matched.groupby(matched["station_idx"].astype("int64"))
+        .agg(count=("price", "count"), median_price_per_sqm=("price_per_sqm", "median"))
+    )
+    stations = stations.join(station_stats, how="left")
+    stations["count"] = stations["count"].fillna(0).astype(int)
+
+    return {
+        "stations": stations,
+        "tree": cKDTree(stations[["x_km", "y_km"]].to_numpy()),
+        "offers_by_station": offers_by_station,
+        "grid": _grid_aggregates(located, cell_km),
+        "cell_km": cell_km,
+        "unmatched": sorted(located.loc[located["station_idx"].isna(), "metro"].dropna().astype(str).unique()),
+    }
+
+
+def get_spatial_layer(df: pd.DataFrame, cell_km: float = 1.0, version: str = None) -> dict:
+    """
+    Пространственный слой для текущей версии датасета.
+
+    Слой кэшируется в памяти и на диске по версии датасета, хэшу таблицы
+    станций и версии кода (spatial и его локальных зависимостей, включая
+    нормализацию названий). На диске хранится только последний слой.
+    version — ключ, посчитанный один раз при загрузке (например, live_data);
+    без него версия — хэш колонок metro/price/price_per_sqm, что требует
+    прохода по всем строкам.
+    """
+    if version is None:
+        version = frame_hash(df, ["metro", "price", "price_per_sqm"])
+    key = f"{combine_hashes(version, file_hash(STATIONS_PATH), CODE_VERSION)[:16]}-{cell_km}"
+    if key not in _LAYER_CACHE:
+        path = SPATIAL_CACHE_DIR / f"{key}.pkl"
+        if path.exists():
+            layer = load_pickle(path)
+        else:
+            layer = build_spatial_layer(df, cell_km)
+            save_pickle(layer, path)
+            # Слои прошлых версий больше не понадобятся (версия растёт с каждой подгрузкой данных)
+            for stale in SPATIAL_CACHE_DIR.glob("*.pkl"):
+                if stale != path:
+                    stale.unlink(missing_ok=True)
+        _LAYER_CACHE.clear()
+        _LAYER_CACHE[key] = layer
+    return _LAYER_CACHE[key]
+
+
+def nearest_stations(layer: dict, lat: float, lon: float, k: int = 3) -> pd.DataFrame:
+    """k ближайших к точке станций с расстоянием в км."""
+    x, y = project(lat, lon)
+    k = min(k, len(layer["stations"]))
+    distances, idx = layer["tree"].query([float(x), float(y)], k=k)
+    result = layer["stations"].iloc[np.atleast_1d(idx)][["name", "lat", "lon", "count", "median_price_per_sqm"]].copy()
+    result.insert(1, "distance_km", np.round(np.atleast_1d(distances), 2))
+    return result
+
+
+def offers_within_radius(df: pd.DataFrame, lat: float, lon: float, radius_km: float, cell_km: float = 1.0,
+                         version: str = None) -> pd.DataFrame:
+    """
+    Объявления, чья станция лежит в радиусе radius_km от точки.
+
+    Поиск идёт по дереву станций, затем берутся заранее сгруппированные
+    объявления этих станций — строки датасета не просматриваются.
+    """
+    layer = get_spatial_layer(df, cell_km, version)
+    x, y = project(lat, lon)
+    station_ids = layer["tree"].query_ball_point([float(x), float(y)], r=radius_km)
+    positions = [layer["offers_by_station"][s] for s in station_ids if s in layer["offers_by_station"]]
+    if not positions:
+        return df.iloc[[]]
+    return df.iloc[np.sort(np.concatenate(positions))]
+
+
+def radius_summary(df: pd.DataFrame, lat: float, lon: float, radius_km: float, cell_km: float = 1.0,
+                   version: str = None) -> dict:
+    """Число объявлений и медианная цена за м² в радиусе от точки."""
+    nearby = offers_within_radius(df, lat, lon, radius_km, cell_km, version)
+    return {
+        "Объявлений": len(nearby),
+        "Станций": nearby["metro"].nunique(),
+        "Медиана цены, ₽": nearby["price"].median(),
+        "Медиана цены за м², ₽": round(nearby["price_per_sqm"].median(), 2) if len(nearby) else None,
+    }
@@ -0,0 +1,163 @@
+"""
+Проверка качества очищенных данных и карантин.
+
+Правила описаны декларативно: у каждого правила есть имя, описание и
+функция, которая по колонкам датафрейма возвращает булеву маску нарушений
+сразу для всех строк. Пропуски в сравнениях нарушением не считаются —
+за обязательные поля отвечают отдельные правила.
+
+Строки с нарушениями убираются из processed_offers.csv и сохраняются в
+data/quarantine/<обход>.csv с перечнем причин, а число нарушений по
+каждому правилу дописывается в журнал validation_log.csv. Обход определяется
+сырым файлом (дата его изменения и хэш содержимого), а не днём запуска, поэтому
+два обхода, обработанные в один день, не перезаписывают друг друга.
+"""
+from dataclasses import dataclass
+from datetime import date, datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from artifacts import DATA_DIR, file_hash
+
+QUARANTINE_DIR = DATA_DIR / "quarantine"
+VALIDATION_LOG = QUARANTINE_DIR / "validation_log.csv"
+
+MIN_BUILD_YEAR = 1800
+MAX_AREA = 1000
+MIN_CEILING, MAX_CEILING = 2.0, 6.0
+
+
+@dataclass(frozen=True)
+class Rule:
+    """Ограничение на данные: check(df) → маска строк, которые его нарушают."""
+    name: str
+    description: str
+    check: object
+
+
+def _num(df: pd.DataFrame, column: str) -> np.ndarray:
+    """Числовые значения колонки (нечисловые и отсутствующие — NaN)."""
+    if column not in df.columns:
+        return np.full(len(df), np.nan)
+    return pd.to_numeric(df[column], errors="coerce").to_numpy(dtype=float)
+
+
+RULES = [
+    Rule("price_missing", "цена не распознана (например, «Не найдено»)",
+         lambda df: np.isnan(_num(df, "price"))),
+    Rule("price_non_positive", "цена не больше нуля",
+         lambda df: _num(df, "price") <= 0),
+    Rule("link_missing", "нет ссылки на объявление",
+         lambda df: df["link"].isna().to_numpy() | (df["link"].astype(str).str.strip() == "").to_numpy()),
+    Rule("area_out_of_range", f"общая площадь не в (0, {MAX_AREA}] м²",
+         lambda df: (_num(df, "square_meters") <= 0) | (_num(df, "square_meters") > MAX_AREA)),
+    Rule("living_above_total", "жилая площадь больше общей",
+         lambda df: _num(df, "living_meters") > _num(df, "square_meters")),
+    Rule("kitchen_above_total", "площадь кухни больше общей",
+         lambda df: _num(df, "kitchen_meters") > _num(df, "square_meters")),
+    Rule("rooms_above_total", "жилая площадь и кухня вместе больше общей",
+         lambda df: _num(df, "living_meters") + _num(df, "kitchen_meters") > _num(df, "square_meters")),
+    Rule("floor_above_building", "этаж выше этажности дома",
+         lambda df: _num(df, "floor") > _num(df, "building_floors")),
+    Rule("build_year_out_of_range", f"год постройки вне [{MIN_BUILD_YEAR}, текущий год + 5]",
+         lambda df: (_num(df, "build_year") < MIN_BUILD_YEAR) | (_num(df, "build_year") > date.today().year + 5)),
+    Rule("build_year_sources_disagree", "год постройки в технической информации и в информации о доме различается",
+         lambda df: np.abs(_num(df, "build_year_tech") - _num(df, "build_year")) > 0),
+    Rule("ceiling_out_of_range", f"высота потолков вне [{MIN_CEILING}, {MAX_CEILING}] м",
+         lambda df: (_num(df, "ceiling_height") < MIN_CEILING) | (_num(df, "ceiling_height") > MAX_CEILING)),
+]
+
+
+def check_rules(df: pd.DataFrame, rules: list = None) -> pd.DataFrame:
+    """Булева матрица нарушений: строка датафрейма × правило."""
+    rules = RULES if rules is None else rules
+    with np.errstate(invalid="ignore"):
+        return pd.DataFrame({rule.name: np.asarray(rule.check(df), dtype=bool) for rule in rules}, index=df.index)
+
+
+def _reasons(violations: pd.DataFrame) -> pd.Series:
+    """Перечень нарушенных правил через «; » для каждой строки."""
+    names = violations.columns.to_numpy()
+    matrix = violations.to_numpy()
+    return pd.Series(["; ".join(names[row]) for row in matrix], index=violations.index, name="reasons")
+
+
+def crawl_key(raw_path) -> tuple:
+    """
+    Дата и идентификатор обхода по сырому файлу.
+
+    Дата — день последнего изменения файла (когда парсер его записал),
+    идентификатор — дата и начало хэша содержимого.
+    """
+    raw_path = Path(raw_path)
+    crawl_date = datetime.fromtimestamp(raw_path.stat().st_mtime).date()
+    return crawl_date, f"{crawl_date.isoformat()}_{file_hash(raw_path)[:8]}"
+
+
+def _append_log(entry: dict, log_path: Path):
+    """Дописывает строку журнала; повторная проверка того же обхода заменяет запись."""
+    log = pd.read_csv(log_path) if log_path.exists() else pd.DataFrame()
+    if not log.empty:
+        # В старых журналах обход записан только датой
+        crawl = log["crawl"] if "crawl" in log.columns else log["crawl_date"]
+        log = log[crawl.fillna(log["crawl_date"]) != entry["crawl"]]
+    log = pd.concat([log, pd.DataFrame([entry])], ignore_index=True)
+    log.to_csv(log_path, index=False)
+
+
+def validate_offers(df: pd.DataFrame, crawl_date=None, quarantine_dir=None, rules: list = None, crawl=None):
+    """
+    Отделяет строки, нарушающие правила, и записывает карантин и журнал.
+
+    Args:
+        df: очищенные объявления
+        crawl_date: дата обхода (по умолчанию сегодня)
+        quarantine_dir: папка карантина (по умолчанию data/quarantine)
+        rules: список Rule (по умолчанию RULES)
+        crawl: идентификатор обхода (см. crawl_key) — имя файла карантина и
+            ключ записи журнала; по умолчанию дата обхода
+
+    Returns:
+        (valid, counts): строки без нарушений и число нарушений по правилам
+    """
+    crawl_date = pd.Timestamp(crawl_date or date.today()).date().isoformat()
+    crawl = crawl or crawl_date
+    quarantine_dir = Path(quarantine_dir or QUARANTINE_DIR)
+    quarantine_dir.mkdir(parents=True, exist_ok=True)
+
+    violations = check_rules(df, rules)
+    failed = violations.any(axis=1).to_numpy()
+    counts = violations.sum().astype(int)
+
+    quarantined = df[failed].copy()
+    quarantined.insert(0, "reasons", _reasons(violations[failed]))
+    quarantined.to_csv(quarantine_dir / f"{crawl}.csv", index=False)
+
+    _append_log(
+        {"crawl_date": crawl_date, "crawl": crawl, "rows": len(df), "quarantined": int(failed.sum()), **counts.to_dict()},
+        quarantine_dir / VALIDATION_LOG.name,
+    )
+
+    print(f"Проверка данных: в карантин отправлено {failed.sum()} из {len(df)} строк")
+    for name, count in counts[counts > 0].items():
+        print(f"  {name}: {count}")
+    return df[~failed], counts
+
+
+def validate_processed(processed_path, crawl_date=None, quarantine_dir=None, raw_path=None) -> pd.Series:
+    """
+    Проверяет сохранённый processed_offers.csv и перезаписывает его без строк из карантина.
+
+    Файл читается как текст, поэтому прошедшие проверку строки сохраняются без изменений.
+    raw_path — сырой файл обхода: по нему определяются дата и идентификатор обхода.
+    """
+    crawl = None
+    if raw_path is not None:
+        raw_date, crawl = crawl_key(raw_path)
+        crawl_date = crawl_date or raw_date
+    df = pd.read_csv(processed_path, dtype=str, keep_default_na=False)
+    valid, counts = validate_offers(df.replace("", np.nan), crawl_date, quarantine_dir, crawl=crawl)
+    df.loc[valid.index].to_csv(processed_path, index=False)
+    return counts